@@ -6,6 +6,7 @@ def main():
     print("Type 'exit' to quit.\n")
 
     chat_history = []
+    session = {}
 
     while True:
         human_message = input("You: ").strip()
@@ -14,7 +15,9 @@ def main():
             print("Bye")
             break
 
-        response = data_analysis_service(human_message, chat_history=chat_history)
+        response = data_analysis_service(
+            human_message, chat_history=chat_history, session=session
+        )
 
         # Update chat history
         chat_history.append({"role": "user", "content": human_message})
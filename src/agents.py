@@ -8,6 +8,7 @@ from src.tools import SQLAction, UserAction
 def action_identifier(model, input):
     """
     Classifies a user's request into an action type. Uses chat_history from input if present.
+    Uses previous_result from input to decide whether a follow-up can be answered locally.
     """
 
     prompt = ChatPromptTemplate.from_template(
@@ -17,9 +18,23 @@ def action_identifier(model, input):
         Chat history:
         {chat_history}
 
+        Previous result:
+        {previous_result}
+
         User query:
         {query}
 
+        Follow-ups:
+        - Choose 'follow_up' ONLY if the query refines the previous result (filter, sort, top N, re-aggregate)
+        AND every column needed is listed in the previous result. Fill the follow_up transform.
+        - The previous result only holds the rows its question and SQL selected. If the query needs rows
+        outside them (e.g. another year after "only 2024", or all rows after a LIMIT / top N), it is NOT a follow-up.
+        - If the previous rows are already aggregated, only re-aggregate additive measures (counts, sums) with sum,
+        or take min/max. Never mean/median/count/nunique them, and never sum averages, ratios or distinct counts:
+        use a database query instead.
+        - Still write a self-contained action_description, so the question can be re-run against the database
+        if the previous result turns out not to be enough.
+
         Return a structured JSON object describing what the user wants to do.
         """
     )
@@ -114,6 +129,15 @@ def sql_generator(model, input):
         Avoid collisions with 2-3 letter aliases.
         - Use aliases consistently in SELECT/JOIN/WHERE/GROUP BY/ORDER BY. Write explicit JOIN ... ON conditions.
 
+        Rollups:
+        - Tables whose description starts with "Rollup" are pre-aggregated. When a rollup covers the question's
+        grain, measures and filters, query it instead of the base tables.
+
+        Parameters:
+        - Use @name query parameters for user-provided values (dates, thresholds, names, lists) instead of
+        inlining literals, and declare each one in query_parameters with its BigQuery type.
+        - For lists, use IN UNNEST(@name) and set values instead of value.
+
         Ambiguity & limits:
         - If ambiguous, make the smallest reasonable assumption and mention it in sql_description.
                                                                         
@@ -140,6 +164,7 @@ def sql_generator(model, input):
 def sql_answer(model, input):
     """
     Answers a user question using SQL results. Uses chat_history from input if present.
+    Uses result_note from input to qualify estimated (preview) results.
     """
 
     prompt = ChatPromptTemplate.from_template(
@@ -153,7 +178,11 @@ def sql_answer(model, input):
         {question}
                                             
         Use the following DataFrame Results to answer the question:
-        {sql_results}                                
+        {sql_results}
+
+        Result notes (if not "None", the results are estimates: present every affected number as approximate
+        and state the error bounds given here):
+        {result_note}
         """
     )
 
@@ -197,10 +226,15 @@ def sql_generator_for_segmenation(model, input):
         - Use aliases consistently in SELECT/JOIN/WHERE/GROUP BY/ORDER BY.
         - If SELECT contains any expression that is not a single column reference, it MUST have "AS <alias>".
 
+        Rollups:
+        - Tables whose description starts with "Rollup" are pre-aggregated. When a rollup covers the question's
+        entity level, measures and filters, query it instead of the base tables.
+
         Aggregation (required):
         - Aggregate to the requested entity level and time grain. Include the entity_id and any required grouping dimensions.
         - Include only the minimal measures/features implied by the question (counts, sums, mins/maxes, last/first timestamps, etc.).
-        - Apply all implied filters (date windows, status, region, exclusions). Use @params for user-provided values.
+        - Apply all implied filters (date windows, status, region, exclusions). Use @params for user-provided values
+        and declare each one in query_parameters with its BigQuery type (lists: IN UNNEST(@name) with values).
 
         Ambiguity:
         - If anything is ambiguous, make the smallest reasonable assumption and state it in sql_description.
@@ -221,6 +255,7 @@ def sql_generator_for_segmenation(model, input):
         Return a JSON object matching the SQLAction schema with these fields:
         - sql: string (the BigQuery SQL query)
         - sql_description: string (brief: extracted rules + key assumptions)
+        - query_parameters: list (every @param used, with name, type and value/values)
         """
     )
 
@@ -330,6 +365,12 @@ def sql_generator_for_seasonality(model, input):
             If schema provides qualified names, strip qualifiers and use only the final segment.
             - Wrap table names in backticks in FROM/JOIN. Use short, meaningful table aliases and reference columns via aliases.
             - Any non-trivial SELECT expression MUST have `AS <alias>`.
+            - Use @params for user-provided values (date windows, thresholds, names) and declare each one in
+            query_parameters with its BigQuery type (lists: IN UNNEST(@name) with values).
+
+            ROLLUPS:
+            - Tables whose description starts with "Rollup" are pre-aggregated. When a rollup covers the question's
+            time grain, measures and filters, query it instead of the base tables.
 
             ABSOLUTE TABLE NAMING RULE (non-negotiable):
             - ALL table references MUST be unqualified table names only (e.g., `orders`).
@@ -346,6 +387,16 @@ def sql_generator_for_seasonality(model, input):
             - If anything is ambiguous, make the smallest reasonable assumption and state it in sql_description.
             - If required fields/tables are missing, state the limitation in sql_description and output the closest valid query.
 
+            TIME SERIES (cacheable form):
+            - If the query is a plain per-bucket aggregate (one DATE_TRUNC time bucket, optional grouping
+            dimensions, aggregate metrics, a date window), ALSO fill time_series with the same query in structured
+            form: from_clause, timestamp_column, grain, metrics, dimensions, filter_clause (WITHOUT the date window)
+            and start_date/end_date (the date window). Both forms must return the same data.
+            - start_date (and end_date, exclusive, if set) MUST be the first day of a bucket (first of the
+            month for MONTH, a Sunday for WEEK, etc.). If the question does not fix an exact start day, align the
+            window to a bucket boundary in BOTH forms; otherwise leave time_series empty.
+            - Leave time_series empty for anything else (window functions, nested queries, rolling averages).
+
             SELF-CHECK:
             - No qualified identifiers anywhere (no '.' in any table token).
             - Ensure no table identifier contains '.' anywhere.
@@ -360,6 +411,8 @@ def sql_generator_for_seasonality(model, input):
             Return a JSON object matching the SQLAction schema with these fields:
             - sql: string (the BigQuery SQL query)
             - sql_description: string (brief: extracted rules + key assumptions)
+            - query_parameters: list (every @param used, with name, type and value/values)
+            - time_series: object or empty (structured form of a plain per-bucket aggregate)
         """
     )
 
@@ -376,6 +429,7 @@ def sql_generator_for_seasonality(model, input):
 def sql_answer_for_seasonality(model, input):
     """
     Answers a seasonality/trends/patterns question using results. Uses chat_history from input if present.
+    Uses result_note from input to qualify estimated (preview) results.
     """
 
     prompt = ChatPromptTemplate.from_template(
@@ -436,6 +490,10 @@ def sql_answer_for_seasonality(model, input):
 
             Seasonality/Trends results DataFrames:
             {table}
+
+            Result notes (if not "None", the results are estimates: present every affected number as approximate
+            and state the error bounds given here):
+            {result_note}
         """
     )
 
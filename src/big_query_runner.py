@@ -1,9 +1,59 @@
 import logging
-from typing import Any, Dict, List, Optional
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Hashable, List, Optional, Tuple, Union
 
 import pandas as pd
 from google.cloud import bigquery
 
+try:
+    from google.cloud import bigquery_storage
+except ImportError:  # Optional: results then download through REST pages
+    bigquery_storage = None
+
+from src.result_store import SpilledResult, accountant, collect_batches
+from src.tools import QueryParameter, QueryParameterType
+
+# Number of query results kept in the in-process result cache
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "64"))
+# Seconds a cached result is served before the query runs again (source tables refresh)
+RESULT_CACHE_TTL_SECONDS = int(os.getenv("RESULT_CACHE_TTL_SECONDS", "900"))
+
+# Rows fetched per result page when streaming results
+RESULT_PAGE_SIZE = int(os.getenv("RESULT_PAGE_SIZE", "50000"))
+# Parallel BigQuery Storage API read streams per result; each buffers at most one batch
+RESULT_STREAM_COUNT = int(os.getenv("RESULT_STREAM_COUNT", "4"))
+
+# Tables large enough that a sampled preview is worth it
+SAMPLED_TABLES = ("order_items",)
+
+_COUNT_DISTINCT = re.compile(r"\bCOUNT\s*\(\s*DISTINCT\s+", re.IGNORECASE)
+_ADDITIVE_AGGREGATE = re.compile(r"\b(COUNT|COUNTIF|SUM)\s*\(", re.IGNORECASE)
+# Functions whose result changes between runs; queries using them are never cached
+_NON_DETERMINISTIC = re.compile(
+    r"\b(CURRENT_DATE|CURRENT_DATETIME|CURRENT_TIME|CURRENT_TIMESTAMP|RAND|GENERATE_UUID|SESSION_USER)\b",
+    re.IGNORECASE,
+)
+_NESTED_QUERY = re.compile(r"^\s*WITH\b|\(\s*SELECT\b", re.IGNORECASE)
+# Joins and set operations that keep rows not driven by the sampled FROM table
+_UNSCALABLE_JOIN = re.compile(
+    r"\b(?:LEFT|RIGHT|FULL|CROSS)\s+(?:OUTER\s+)?JOIN\b|\b(?:UNION|EXCEPT|INTERSECT)\b",
+    re.IGNORECASE,
+)
+# Relative standard error of APPROX_COUNT_DISTINCT (HLL++ at precision 15): 1.04 / sqrt(2^15)
+HLL_RELATIVE_ERROR = 1.04 / math.sqrt(2**15)
+_CLAUSE_KEYWORDS = (
+    "ON|USING|WHERE|JOIN|INNER|LEFT|RIGHT|FULL|CROSS|GROUP|ORDER|LIMIT|"
+    "HAVING|QUALIFY|WINDOW|UNION|EXCEPT|INTERSECT|TABLESAMPLE|FOR"
+)
+
 
 class BigQueryRunner:
     """A lean BigQuery client for executing SQL queries and returning DataFrame results."""
@@ -28,44 +78,256 @@ class BigQueryRunner:
                 ),
             )
             self.dataset_id = dataset_id
+            self._bqstorage_client = None
+            self._executor = ThreadPoolExecutor(max_workers=2)
+            self._result_cache: "OrderedDict[Hashable, Tuple[float, Union[pd.DataFrame, SpilledResult]]]" = (
+                OrderedDict()
+            )
+            self._cache_lock = threading.Lock()
             logging.info(f"BigQuery client initialized for dataset: {self.dataset_id}")
         except Exception as e:
             logging.debug(f"Failed to initialize BigQuery client: {str(e)}")
             raise
 
-    def execute_query(self, sql_query: str) -> pd.DataFrame:
+    def execute_query(
+        self,
+        sql_query: str,
+        query_parameters: Optional[List[QueryParameter]] = None,
+        use_cache: bool = True,
+    ) -> Union[pd.DataFrame, SpilledResult]:
         """Execute a SQL query and return results as a DataFrame.
 
+        Results are cached in process by SQL template plus parameter values, so
+        questions that differ only in values reuse both this cache and
+        BigQuery's own result cache. Cached results expire after
+        RESULT_CACHE_TTL_SECONDS, and queries using non-deterministic functions
+        such as CURRENT_DATE() are never cached.
+
+        Results are streamed batch by batch through the BigQuery Storage API
+        (REST pages if it is not installed), with at most RESULT_STREAM_COUNT
+        streams each buffering one batch. A result larger than
+        RESULT_SPILL_THRESHOLD_BYTES is spilled to a Parquet file and returned as
+        a SpilledResult handle to be scanned in chunks. Least recently used
+        entries are evicted from the result cache while it holds more than
+        RESULT_CACHE_SIZE entries or tracked frames exceed the memory limit.
+
         Args:
-            sql_query: The SQL query to execute.
+            sql_query: The SQL query to execute, referencing parameters as @name.
+            query_parameters: Typed values bound to the query's @name parameters.
+            use_cache: Whether to read and populate the in-process result cache.
 
         Returns:
-            DataFrame containing the query results.
+            DataFrame containing the query results, or a SpilledResult for large results.
 
         Raises:
             Exception: If query execution fails.
         """
+        query_parameters = query_parameters or []
+        use_cache = use_cache and is_cacheable(sql_query)
+        key = cache_key(sql_query, query_parameters)
+        with self._cache_lock:
+            if use_cache and key in self._result_cache:
+                expires_at, cached = self._result_cache[key]
+                if time.monotonic() < expires_at:
+                    self._result_cache.move_to_end(key)
+                    logging.info("Query served from result cache")
+                    return cached
+                del self._result_cache[key]
         try:
             logging.info(f"Executing BigQuery query")
-            query_job = self.client.query(sql_query)
-            df = query_job.result().to_dataframe()
+            job_config = bigquery.QueryJobConfig(
+                query_parameters=[to_bigquery_parameter(p) for p in query_parameters]
+            )
+            query_job = self.client.query(sql_query, job_config=job_config)
+            rows = query_job.result(page_size=RESULT_PAGE_SIZE)
+            if rows.total_rows:
+                df = collect_batches(
+                    rows.to_arrow_iterable(
+                        bqstorage_client=self.bqstorage_client(),
+                        max_queue_size=RESULT_STREAM_COUNT,
+                        max_stream_count=RESULT_STREAM_COUNT,
+                    )
+                )
+            else:
+                df = accountant.track(rows.to_dataframe())
             logging.info(f"Query completed successfully, returned {len(df)} rows")
-            return df
         except Exception as e:
             logging.debug(f"BigQuery execution failed: {str(e)}")
             raise
+        if not use_cache:
+            return df
+        with self._cache_lock:
+            self._result_cache[key] = (time.monotonic() + RESULT_CACHE_TTL_SECONDS, df)
+            while len(self._result_cache) > RESULT_CACHE_SIZE or (
+                accountant.over_limit() and len(self._result_cache) > 1
+            ):
+                self._result_cache.popitem(last=False)
+        return df
+
+    def bqstorage_client(self):
+        """Return the BigQuery Storage API read client, created on first use.
+
+        Returns:
+            BigQueryReadClient, or None if google-cloud-bigquery-storage is not installed.
+        """
+        if bigquery_storage is not None and self._bqstorage_client is None:
+            self._bqstorage_client = bigquery_storage.BigQueryReadClient()
+        return self._bqstorage_client
+
+    def submit_query(
+        self,
+        sql_query: str,
+        query_parameters: Optional[List[QueryParameter]] = None,
+    ) -> Future:
+        """Execute a SQL query in the background.
+
+        Args:
+            sql_query: The SQL query to execute.
+            query_parameters: Typed values bound to the query's @name parameters.
+
+        Returns:
+            Future resolving to the result returned by execute_query.
+        """
+        return self._executor.submit(self.execute_query, sql_query, query_parameters)
+
+    @staticmethod
+    def is_previewable(sql_query: str) -> bool:
+        """Check whether a query reads a table that approximate mode samples."""
+        return any(
+            re.search(_table_reference(table), sql_query, re.IGNORECASE)
+            for table in SAMPLED_TABLES
+        )
+
+    @staticmethod
+    def approximate_query(
+        sql_query: str, sample_percent: float
+    ) -> Optional[Tuple[str, str]]:
+        """Rewrite a query into a cheaper approximate form.
+
+        Queries with exact distinct counts only have them replaced by
+        APPROX_COUNT_DISTINCT; they are not sampled, because a distinct count
+        over a sample cannot be scaled back up. Other single-block aggregate
+        queries read the large tables through TABLESAMPLE and have COUNT,
+        COUNTIF and SUM scaled by the sampling factor. Scaling is only valid when
+        every output row comes from a sampled row, so the sampled table must be
+        the driving FROM table and all joins must be INNER. Queries with CTEs,
+        subqueries, outer/cross joins, set operations or a sampled table on the
+        joined side are not approximated.
+
+        Args:
+            sql_query: The exact SQL query.
+            sample_percent: Percentage of table blocks to read (0-100].
+
+        Returns:
+            Tuple of the rewritten query and a note stating its error bounds,
+            or None when the query has no safe approximate form.
+        """
+        if _COUNT_DISTINCT.search(sql_query):
+            note = (
+                "Distinct counts are estimated with APPROX_COUNT_DISTINCT (HyperLogLog++) over all rows: "
+                f"relative standard error about ±{HLL_RELATIVE_ERROR:.1%}, "
+                f"within about ±{1.96 * HLL_RELATIVE_ERROR:.1%} at 95% confidence. "
+                "All other values are exact."
+            )
+            return _COUNT_DISTINCT.sub("APPROX_COUNT_DISTINCT(", sql_query), note
+
+        if (
+            _NESTED_QUERY.search(sql_query)
+            or _UNSCALABLE_JOIN.search(sql_query)
+            or not _ADDITIVE_AGGREGATE.search(sql_query)
+        ):
+            return None
+
+        approximate = sql_query
+        for table in SAMPLED_TABLES:
+            if re.search(_table_reference(table, "JOIN"), sql_query, re.IGNORECASE):
+                return None
+            approximate = re.sub(
+                rf"({_table_reference(table, 'FROM')}"
+                rf"(?:\s+(?:AS\s+)?(?!(?:{_CLAUSE_KEYWORDS})\b)\w+)?)",
+                rf"\1 TABLESAMPLE SYSTEM ({sample_percent:g} PERCENT)",
+                approximate,
+                flags=re.IGNORECASE,
+            )
+        if approximate == sql_query:
+            return None
+        factor = 100 / sample_percent
+        approximate = _scale_additive_aggregates(approximate, factor)
+
+        fraction = sample_percent / 100
+        # Relative standard error of a scaled count backed by n sampled rows is
+        # sqrt((1 - f) / n); quote the 95% bound for a group of 1,000 rows.
+        bound = 1.96 * math.sqrt((1 - fraction) / 1000)
+        note = (
+            f"Estimated from a {sample_percent:g}% block sample of {', '.join(SAMPLED_TABLES)}. "
+            f"COUNT, COUNTIF and SUM values are scaled up by {factor:g}x; for a group backed by "
+            f"1,000 sampled rows they are within about ±{bound:.0%} at 95% confidence, more for "
+            "smaller groups (block sampling adds variance). Averages are unscaled estimates; "
+            "MIN/MAX only reflect the sampled rows."
+        )
+        return approximate, note
+
+    def execute_preview_query(
+        self,
+        sql_query: str,
+        query_parameters: Optional[List[QueryParameter]] = None,
+        sample_percent: float = 10,
+    ) -> Optional[Tuple[Union[pd.DataFrame, SpilledResult], str]]:
+        """Execute the approximate form of a query for a fast first answer.
+
+        Args:
+            sql_query: The exact SQL query.
+            query_parameters: Typed values bound to the query's @name parameters.
+            sample_percent: Percentage of table blocks to read (0-100].
+
+        Returns:
+            Tuple of the preview result and a note stating its error bounds, or
+            None when the query has no safe approximate form.
+
+        Raises:
+            Exception: If query execution fails.
+        """
+        approximate = self.approximate_query(sql_query, sample_percent)
+        if approximate is None:
+            return None
+        approximate_sql, note = approximate
+        logging.info(f"Executing approximate preview at {sample_percent:g}% sample")
+        return self.execute_query(approximate_sql, query_parameters), note
+
+    def execute_statement(self, sql_script: str) -> None:
+        """Execute a DDL/DML statement or multi-statement script.
+
+        Args:
+            sql_script: The SQL statement(s) to execute.
+
+        Raises:
+            Exception: If execution fails.
+        """
+        try:
+            logging.info("Executing BigQuery statement")
+            query_job = self.client.query(sql_script)
+            query_job.result()
+            logging.info(
+                f"Statement completed, processed {query_job.total_bytes_processed or 0} bytes"
+            )
+        except Exception as e:
+            logging.debug(f"BigQuery statement failed: {str(e)}")
+            raise
 
-    def get_table_schema(self, table_name: str) -> List[Dict[str, Any]]:
+    def get_table_schema(
+        self, table_name: str, dataset_id: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
         """Get schema information for a specific table.
 
         Args:
             table_name: Name of the table (orders, order_items, products, users).
+            dataset_id: Dataset holding the table. If None, uses the runner's dataset.
 
         Returns:
             List of dictionaries containing column information.
         """
         try:
-            table_ref = f"{self.dataset_id}.{table_name}"
+            table_ref = f"{dataset_id or self.dataset_id}.{table_name}"
             table = self.client.get_table(table_ref)
             schema_info = []
             for field in table.schema:
@@ -82,3 +344,104 @@ class BigQueryRunner:
         except Exception as e:
             logging.debug(f"Failed to get schema for table {table_name}: {str(e)}")
             raise
+
+
+def is_cacheable(sql_query: str) -> bool:
+    """Check that a query's result only depends on its text, parameters and tables."""
+    return not _NON_DETERMINISTIC.search(sql_query)
+
+
+def cache_key(
+    sql_query: str, query_parameters: List[QueryParameter]
+) -> Tuple[str, Tuple[Hashable, ...]]:
+    """Build a result cache key from the SQL template and parameter values.
+
+    Args:
+        sql_query: The parameterized SQL query.
+        query_parameters: Typed values bound to the query's @name parameters.
+
+    Returns:
+        Hashable key with whitespace-normalized SQL and sorted parameter values.
+    """
+    template = " ".join(sql_query.split())
+    values = tuple(
+        sorted(
+            (p.name, str(p.type), p.value, tuple(p.values) if p.values is not None else None)
+            for p in query_parameters
+        )
+    )
+    return template, values
+
+
+def _convert_value(value: str, parameter_type: QueryParameterType) -> Any:
+    """Convert a string-encoded parameter value to its Python type."""
+    if parameter_type == QueryParameterType.INT64:
+        return int(value)
+    if parameter_type == QueryParameterType.FLOAT64:
+        return float(value)
+    if parameter_type == QueryParameterType.NUMERIC:
+        return Decimal(value)
+    if parameter_type == QueryParameterType.BOOL:
+        return value.strip().lower() in ("true", "1", "yes")
+    if parameter_type == QueryParameterType.DATE:
+        return date.fromisoformat(value)
+    if parameter_type in (QueryParameterType.DATETIME, QueryParameterType.TIMESTAMP):
+        return datetime.fromisoformat(value)
+    return value
+
+
+def to_bigquery_parameter(parameter: QueryParameter):
+    """Convert a QueryParameter to a BigQuery scalar or array query parameter.
+
+    Args:
+        parameter: The typed parameter from the SQL generator.
+
+    Returns:
+        ScalarQueryParameter, or ArrayQueryParameter when values is set.
+    """
+    if parameter.values is not None:
+        return bigquery.ArrayQueryParameter(
+            parameter.name,
+            str(parameter.type),
+            [_convert_value(v, parameter.type) for v in parameter.values],
+        )
+    value = None if parameter.value is None else _convert_value(parameter.value, parameter.type)
+    return bigquery.ScalarQueryParameter(parameter.name, str(parameter.type), value)
+
+
+def _table_reference(table: str, keywords: str = "FROM|JOIN") -> str:
+    """Regex for a FROM/JOIN reference to a table, optionally qualified or backticked.
+
+    keywords restricts the clauses matched, e.g. "FROM" for the driving table only.
+
+    The table name must be followed by whitespace, a closing parenthesis, a comma,
+    a semicolon or the end of the query, so column references such as
+    `EXTRACT(YEAR FROM order_items.created_at)` do not match.
+    """
+    return rf"\b(?:{keywords})\s+`?(?:[\w-]+\.)*{table}`?(?=\s|[),;]|$)"
+
+
+def _scale_additive_aggregates(sql_query: str, factor: float) -> str:
+    """Wrap COUNT/COUNTIF/SUM calls as (CALL * factor), skipping analytic calls."""
+    parts = []
+    position = 0
+    for match in _ADDITIVE_AGGREGATE.finditer(sql_query):
+        if match.start() < position:
+            continue
+        depth = 0
+        end = None
+        for index in range(match.end() - 1, len(sql_query)):
+            if sql_query[index] == "(":
+                depth += 1
+            elif sql_query[index] == ")":
+                depth -= 1
+                if depth == 0:
+                    end = index + 1
+                    break
+        if end is None or re.match(r"\s*OVER\b", sql_query[end:], re.IGNORECASE):
+            continue
+        parts.append(sql_query[position : match.start()])
+        parts.append(f"({sql_query[match.start():end]} * {factor:g})")
+        position = end
+    parts.append(sql_query[position:])
+    return "".join(parts)
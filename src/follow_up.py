@@ -0,0 +1,232 @@
+import ast
+import logging
+import re
+from typing import Any, Dict, Iterable, Optional, Union
+
+import pandas as pd
+
+from src.result_store import SpilledResult, accountant
+from src.tools import AggregationFunction, FollowUpTransform
+
+
+# Functions that make a SQL result one row per group rather than one row per record
+_AGGREGATED_SQL = re.compile(
+    r"\bGROUP\s+BY\b|\bSELECT\s+DISTINCT\b|"
+    r"\b(?:COUNT|COUNTIF|SUM|AVG|MIN|MAX|APPROX_COUNT_DISTINCT|STDDEV\w*|VARIANCE)\s*\(",
+    re.IGNORECASE,
+)
+_LIMIT = re.compile(r"\bLIMIT\s+(\d+)", re.IGNORECASE)
+# Aggregations that give the same answer over per-group rows as over the underlying rows
+_REAGGREGATABLE = (AggregationFunction.SUM, AggregationFunction.MIN, AggregationFunction.MAX)
+
+
+def is_aggregated(source: Optional[Dict[str, Any]]) -> bool:
+    """Check whether a result holds aggregated rows rather than source records.
+
+    Args:
+        source: How the result was produced: question, sql_query and the
+            follow_ups applied to it since.
+    """
+    if not source:
+        return False
+    if any(follow_up.aggregations for follow_up in source.get("follow_ups", [])):
+        return True
+    return bool(_AGGREGATED_SQL.search(source.get("sql_query") or ""))
+
+
+def row_limit(source: Optional[Dict[str, Any]]) -> Optional[int]:
+    """Return the row limit applied to a result, if any (smallest of LIMIT and follow-ups)."""
+    if not source:
+        return None
+    limits = [int(limit) for limit in _LIMIT.findall(source.get("sql_query") or "")]
+    limits += [
+        follow_up.limit
+        for follow_up in source.get("follow_ups", [])
+        if follow_up.limit is not None
+    ]
+    return min(limits) if limits else None
+
+
+def describe_result(
+    previous: Optional[Union[pd.DataFrame, SpilledResult]],
+    source: Optional[Dict[str, Any]] = None,
+) -> str:
+    """Describe the previous result for the action identifier prompt.
+
+    Args:
+        previous: The previous turn's result, if any.
+        source: How the result was produced: question, sql_query and the
+            follow_ups applied to it since.
+
+    Returns:
+        A short description with the row count, column names/types and how the
+        rows were produced (question, SQL, limit, aggregation).
+    """
+    if previous is None:
+        return "No previous result."
+    if isinstance(previous, SpilledResult):
+        types = [(field.name, field.type) for field in previous.schema]
+    else:
+        types = list(previous.dtypes.items())
+    columns = ", ".join(f"{name} ({dtype})" for name, dtype in types)
+    description = f"{len(previous)} rows with columns: {columns}"
+    if not source:
+        return description
+    description += f"\nAnswers: {source.get('question')}"
+    description += f"\nSQL: {source.get('sql_query')}"
+    for follow_up in source.get("follow_ups", []):
+        description += f"\nThen applied locally: {follow_up.model_dump(exclude_defaults=True)}"
+    limit = row_limit(source)
+    if limit is not None:
+        description += (
+            f"\nLimited to {limit} rows: rows outside the limit are not in the result."
+        )
+    if is_aggregated(source):
+        description += (
+            "\nRows are already aggregated (one row per group), not source records."
+        )
+    return description
+
+
+# Nodes a filter expression may contain: comparisons of columns and literals only
+_ALLOWED_FILTER_NODES = (
+    ast.Expression,
+    ast.Compare,
+    ast.BoolOp,
+    ast.UnaryOp,
+    ast.Name,
+    ast.Constant,
+    ast.List,
+    ast.Load,
+    ast.And,
+    ast.Or,
+    ast.Not,
+    ast.USub,
+    ast.Eq,
+    ast.NotEq,
+    ast.Lt,
+    ast.LtE,
+    ast.Gt,
+    ast.GtE,
+    ast.In,
+    ast.NotIn,
+)
+
+
+def is_safe_filter(expression: str, columns: Iterable[str]) -> bool:
+    """Check that a DataFrame.query expression only compares columns with literals.
+
+    Calls, attribute access, subscripts and arithmetic are rejected, so the
+    expression cannot run arbitrary methods (e.g. writing files via to_csv).
+
+    Args:
+        expression: The filter expression from the follow-up transform.
+        columns: Columns of the result it will be applied to.
+
+    Returns:
+        True if every node is allowed and every name is a column.
+    """
+    columns = set(columns)
+    # Backticked column names are not valid Python; check them and parse a placeholder
+    if not set(re.findall(r"`([^`]*)`", expression)) <= columns:
+        return False
+    source = re.sub(r"`[^`]*`", "_backticked_column", expression)
+    try:
+        tree = ast.parse(source, mode="eval")
+    except SyntaxError:
+        return False
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_FILTER_NODES):
+            return False
+        if isinstance(node, ast.Name) and node.id not in columns | {"_backticked_column"}:
+            return False
+    return True
+
+
+def apply_follow_up(
+    previous: Union[pd.DataFrame, SpilledResult],
+    transform: FollowUpTransform,
+    source: Optional[Dict[str, Any]] = None,
+) -> Optional[pd.DataFrame]:
+    """Apply a follow-up transform to the previous result in process.
+
+    Spilled results are filtered chunk by chunk; if the matching rows exceed the
+    per-result spill threshold, the follow-up goes back to BigQuery. So does a
+    filter that leaves no rows, since the previous result may already have been
+    filtered or limited, and any aggregation other than sum/min/max over rows
+    that are already aggregated (e.g. a mean of means).
+
+    Args:
+        previous: The previous turn's result.
+        transform: The filter/aggregate/sort/limit steps to apply.
+        source: How the previous result was produced (see describe_result).
+
+    Returns:
+        The transformed DataFrame, or None when the previous result is not
+        enough to answer the follow-up and BigQuery must be queried instead.
+    """
+    available = set(previous.columns)
+    referenced = set(transform.group_by) | {
+        aggregation.column for aggregation in transform.aggregations
+    }
+    if not referenced <= available:
+        logging.info(f"Follow-up references missing columns: {referenced - available}")
+        return None
+    if is_aggregated(source) and any(
+        aggregation.function not in _REAGGREGATABLE
+        for aggregation in transform.aggregations
+    ):
+        logging.info("Follow-up would re-aggregate aggregated rows non-additively")
+        return None
+
+    try:
+        df = previous
+        if transform.filter_expression:
+            if not is_safe_filter(transform.filter_expression, previous.columns):
+                logging.info("Follow-up filter rejected as unsafe")
+                return None
+            if isinstance(df, SpilledResult):
+                df = df.filter(transform.filter_expression)
+                if df is None:
+                    return None
+            else:
+                df = df.query(transform.filter_expression)
+            if df.empty:
+                logging.info("Follow-up filter left no rows of the previous result")
+                return None
+        elif isinstance(df, SpilledResult):
+            df = df.filter(None)
+            if df is None:
+                return None
+
+        if transform.aggregations:
+            named = {
+                aggregation.alias
+                or f"{aggregation.function}_{aggregation.column}": (
+                    aggregation.column,
+                    str(aggregation.function),
+                )
+                for aggregation in transform.aggregations
+            }
+            if transform.group_by:
+                df = df.groupby(transform.group_by, dropna=False).agg(**named)
+                df = df.reset_index()
+            else:
+                df = pd.DataFrame(
+                    [{alias: df[column].agg(func) for alias, (column, func) in named.items()}]
+                )
+
+        if transform.sort_by:
+            df = df.sort_values(by=transform.sort_by, ascending=transform.ascending)
+
+        if transform.columns:
+            df = df[transform.columns]
+
+        if transform.limit is not None:
+            df = df.head(transform.limit)
+    except Exception as e:
+        logging.debug(f"Follow-up could not be applied locally: {str(e)}")
+        return None
+
+    logging.info(f"Follow-up answered locally, returned {len(df)} rows")
+    return accountant.track(df.reset_index(drop=True))
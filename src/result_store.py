@@ -0,0 +1,289 @@
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+import weakref
+from typing import Iterable, Iterator, List, Optional, Union
+
+import db_dtypes
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+# Process-wide budget for result frames held in memory; caches evict to stay under it
+RESULT_MEMORY_LIMIT_BYTES = int(os.getenv("RESULT_MEMORY_LIMIT_MB", "512")) * 1024**2
+# A single result larger than this spills to disk instead of being loaded
+RESULT_SPILL_THRESHOLD_BYTES = min(
+    int(os.getenv("RESULT_SPILL_THRESHOLD_MB", "64")) * 1024**2,
+    RESULT_MEMORY_LIMIT_BYTES,
+)
+# Directory for spilled results
+RESULT_SPILL_DIR = os.getenv("RESULT_SPILL_DIR") or tempfile.gettempdir()
+# Rows per chunk when scanning spilled results
+CHUNK_ROWS = 100_000
+
+
+def to_pandas(data: Union[pa.Table, pa.RecordBatch]) -> pd.DataFrame:
+    """Convert Arrow data to pandas with the same dtypes as RowIterator.to_dataframe.
+
+    Nullable INT64 and BOOL stay Int64/boolean instead of float64/object, and
+    DATE/TIME use the db-dtypes extension types.
+    """
+
+    def types_mapper(arrow_type: pa.DataType):
+        if pa.types.is_boolean(arrow_type):
+            return pd.BooleanDtype()
+        if pa.types.is_integer(arrow_type):
+            return pd.Int64Dtype()
+        if pa.types.is_date32(arrow_type):
+            return db_dtypes.DateDtype()
+        if pa.types.is_time(arrow_type):
+            return db_dtypes.TimeDtype()
+        return None
+
+    return data.to_pandas(types_mapper=types_mapper)
+
+
+def memory_usage(df: pd.DataFrame) -> int:
+    """Return the bytes held by a DataFrame, including object contents."""
+    return int(df.memory_usage(deep=True).sum())
+
+
+class ResultMemoryAccountant:
+    """Tracks the bytes held by result frames kept in this process.
+
+    Every frame that outlives a turn (query results, follow-up results, loaded
+    spilled rows, time-series cache entries) is tracked until it is garbage
+    collected; caches evict entries while the total is over the limit.
+    """
+
+    def __init__(self, limit_bytes: int) -> None:
+        """Initialize the accountant.
+
+        Args:
+            limit_bytes: Total bytes in-memory results may hold.
+        """
+        self.limit_bytes = limit_bytes
+        self.held_bytes = 0
+        self._lock = threading.Lock()
+
+    def over_limit(self) -> bool:
+        """Check whether tracked frames hold more than the limit."""
+        with self._lock:
+            return self.held_bytes > self.limit_bytes
+
+    def track(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Account for a frame until it is garbage collected."""
+        nbytes = memory_usage(df)
+        with self._lock:
+            self.held_bytes += nbytes
+        weakref.finalize(df, self._release, nbytes)
+        return df
+
+    def _release(self, nbytes: int) -> None:
+        with self._lock:
+            self.held_bytes -= nbytes
+
+
+accountant = ResultMemoryAccountant(RESULT_MEMORY_LIMIT_BYTES)
+
+
+class SpilledResult:
+    """Lazy handle to a query result stored as a Parquet file on disk.
+
+    Downstream stages scan it in chunks instead of loading it whole. Its string
+    form is a bounded summary (shape, first rows, per-column stats), so it can be
+    passed to the answer prompts in place of a DataFrame.
+    """
+
+    def __init__(self, path: str, stats: Optional[pd.DataFrame] = None) -> None:
+        """Open a spilled result.
+
+        Args:
+            path: Parquet file holding the result; deleted when the handle is collected.
+            stats: Numeric column statistics computed while writing, if available.
+        """
+        self.path = path
+        self._stats = stats
+        self._file = pq.ParquetFile(path)
+        self.schema = self._file.schema_arrow
+        self.columns: List[str] = self.schema.names
+        self.num_rows = self._file.metadata.num_rows
+        weakref.finalize(self, _remove, path)
+
+    def __len__(self) -> int:
+        return self.num_rows
+
+    def iter_chunks(
+        self, chunk_rows: int = CHUNK_ROWS, columns: Optional[List[str]] = None
+    ) -> Iterator[pd.DataFrame]:
+        """Yield the result as DataFrames of at most chunk_rows rows.
+
+        Args:
+            chunk_rows: Maximum rows per chunk.
+            columns: Columns to read. If None, reads all columns.
+        """
+        for batch in self._file.iter_batches(batch_size=chunk_rows, columns=columns):
+            yield to_pandas(batch)
+
+    def head(self, n: int = 5) -> pd.DataFrame:
+        """Return the first n rows."""
+        for chunk in self.iter_chunks(chunk_rows=n):
+            return chunk
+        return to_pandas(self.schema.empty_table())
+
+    def filter(
+        self, expression: Optional[str], max_bytes: int = RESULT_SPILL_THRESHOLD_BYTES
+    ) -> Optional[pd.DataFrame]:
+        """Load the rows matching a DataFrame.query expression, chunk by chunk.
+
+        Args:
+            expression: Filter expression. If None, loads all rows.
+            max_bytes: Memory the filtered rows may take.
+
+        Returns:
+            The matching rows (tracked), or None if they would exceed max_bytes.
+        """
+        frames, held = [], 0
+        for chunk in self.iter_chunks():
+            if expression:
+                chunk = chunk.query(expression)
+            held += memory_usage(chunk)
+            if held > max_bytes:
+                return None
+            frames.append(chunk)
+        if not frames:
+            return self.head(0)
+        return accountant.track(pd.concat(frames, ignore_index=True))
+
+    def describe(self) -> pd.DataFrame:
+        """Return count/min/max/mean of numeric columns, computed once."""
+        if self._stats is None:
+            stats = _NumericStats(self.schema)
+            for batch in self._file.iter_batches(batch_size=CHUNK_ROWS):
+                stats.update(batch)
+            self._stats = stats.to_frame()
+        return self._stats
+
+    def export(self, path: str) -> None:
+        """Write the result to a .csv (streamed in chunks) or .parquet file.
+
+        Args:
+            path: Destination file path.
+        """
+        if path.endswith(".csv"):
+            for index, chunk in enumerate(self.iter_chunks()):
+                chunk.to_csv(path, mode="w" if index == 0 else "a", header=index == 0, index=False)
+        else:
+            shutil.copyfile(self.path, path)
+
+    def __str__(self) -> str:
+        return (
+            f"Result too large to load ({self.num_rows} rows, columns: {', '.join(self.columns)}).\n"
+            f"First rows:\n{self.head(20)}\n"
+            f"Numeric column statistics over all rows:\n{self.describe()}"
+        )
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class _NumericStats:
+    """Accumulates count/sum/min/max of numeric Arrow columns batch by batch."""
+
+    def __init__(self, schema: pa.Schema) -> None:
+        self.columns = [
+            field.name
+            for field in schema
+            if pa.types.is_integer(field.type)
+            or pa.types.is_floating(field.type)
+            or pa.types.is_decimal(field.type)
+        ]
+        self.stats = {}
+
+    def update(self, batch: pa.RecordBatch) -> None:
+        for column in self.columns:
+            values = batch.column(column)
+            count = pc.count(values).as_py()
+            if not count:
+                continue
+            extremes = pc.min_max(values)
+            low, high = extremes["min"].as_py(), extremes["max"].as_py()
+            current = self.stats.setdefault(
+                column, {"count": 0, "sum": 0.0, "min": low, "max": high}
+            )
+            current["count"] += count
+            current["sum"] += float(pc.sum(values).as_py())
+            current["min"] = min(current["min"], low)
+            current["max"] = max(current["max"], high)
+
+    def to_frame(self) -> pd.DataFrame:
+        frame = {}
+        for column, current in self.stats.items():
+            frame[column] = {
+                "count": current["count"],
+                "mean": current["sum"] / current["count"],
+                "min": current["min"],
+                "max": current["max"],
+            }
+        return pd.DataFrame(frame)
+
+
+def collect_batches(
+    batches: Iterable[pa.RecordBatch],
+) -> Union[pd.DataFrame, SpilledResult]:
+    """Collect streamed record batches, spilling large results to Parquet.
+
+    Batches are kept in memory while the result fits under
+    RESULT_SPILL_THRESHOLD_BYTES. Once it does not, the batches seen so far and
+    every following batch are written to a Parquet file, so at most one batch
+    beyond the threshold is held at a time. Numeric column statistics are
+    computed while writing, so summarizing the spilled result needs no rescan.
+
+    Args:
+        batches: Record batches, e.g. one per result page. Must not be empty.
+
+    Returns:
+        A tracked DataFrame, or a SpilledResult handle for large results.
+    """
+    held: List[pa.RecordBatch] = []
+    held_bytes = 0
+    writer = None
+    path = None
+    stats = None
+    try:
+        for batch in batches:
+            if writer is None:
+                held.append(batch)
+                held_bytes += batch.nbytes
+                if held_bytes <= RESULT_SPILL_THRESHOLD_BYTES:
+                    continue
+                path = os.path.join(RESULT_SPILL_DIR, f"bq-result-{uuid.uuid4().hex}.parquet")
+                logging.info(f"Result exceeds spill threshold, spilling to {path}")
+                writer = pq.ParquetWriter(path, held[0].schema)
+                stats = _NumericStats(held[0].schema)
+                for spilled in held:
+                    writer.write_batch(spilled)
+                    stats.update(spilled)
+                held = []
+            else:
+                writer.write_batch(batch)
+                stats.update(batch)
+    except Exception:
+        if writer is not None:
+            writer.close()
+            _remove(path)
+        raise
+
+    if writer is not None:
+        writer.close()
+        return SpilledResult(path, stats=stats.to_frame())
+
+    return accountant.track(to_pandas(pa.Table.from_batches(held)))
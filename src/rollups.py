@@ -0,0 +1,292 @@
+import logging
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+from google.api_core.exceptions import NotFound
+from pydantic import BaseModel, Field
+
+from src.big_query_runner import BigQueryRunner
+
+# Item status changes (e.g. Complete -> Returned) after creation; each refresh
+# re-aggregates this many trailing days so those changes are picked up
+ROLLUP_RESTATEMENT_DAYS = int(os.getenv("ROLLUP_RESTATEMENT_DAYS", "90"))
+
+
+class Rollup(BaseModel):
+    """
+    A pre-aggregated table maintained incrementally from the source tables.
+
+    Both SQL templates use {table} for the fully-qualified rollup table and refresh_sql
+    uses {restatement_days} for the trailing window it re-aggregates; source tables are
+    unqualified and resolve against the runner's default dataset. refresh_sql replaces
+    rows inside a transaction, so readers never see the window missing and a failed
+    refresh leaves the table unchanged.
+    """
+
+    name: str = Field(description="Rollup table name.")
+    description: str = Field(
+        description="What the rollup covers; shown to the SQL generators."
+    )
+    build_sql: str = Field(description="Full (re)build of the rollup table.")
+    refresh_sql: str = Field(
+        description="Incremental refresh from a trailing created_at window only."
+    )
+
+
+ROLLUPS: List[Rollup] = [
+    Rollup(
+        name="daily_sales_by_category",
+        description=(
+            "Rollup of order_items joined to products: one row per sale_date, product category and "
+            "item status with items, revenue (SUM of sale_price) and orders. items and revenue can be "
+            "summed across any dimension. orders is a distinct count valid ONLY per full (sale_date, "
+            "category, status) row: never SUM it across days, categories or statuses (orders with items "
+            "in several categories/statuses would be overcounted); use order_items for order counts at "
+            "other grains. Prefer it over order_items for daily/weekly/monthly revenue or item-count "
+            "trends by category or status."
+        ),
+        build_sql="""
+            CREATE OR REPLACE TABLE `{table}`
+            PARTITION BY sale_date
+            CLUSTER BY category AS
+            SELECT
+                DATE(oi.created_at) AS sale_date,
+                p.category AS category,
+                oi.status AS status,
+                COUNT(DISTINCT oi.order_id) AS orders,
+                COUNT(*) AS items,
+                SUM(oi.sale_price) AS revenue
+            FROM `order_items` oi
+            JOIN `products` p ON p.id = oi.product_id
+            GROUP BY sale_date, category, status
+        """,
+        # Re-aggregate the trailing window, covering late status changes and the partial last day
+        refresh_sql="""
+            DECLARE since DATE DEFAULT (
+                SELECT DATE_SUB(IFNULL(MAX(sale_date), DATE '1970-01-01'), INTERVAL {restatement_days} DAY)
+                FROM `{table}`
+            );
+            BEGIN TRANSACTION;
+            DELETE FROM `{table}` WHERE sale_date >= since;
+            INSERT INTO `{table}` (sale_date, category, status, orders, items, revenue)
+            SELECT
+                DATE(oi.created_at) AS sale_date,
+                p.category AS category,
+                oi.status AS status,
+                COUNT(DISTINCT oi.order_id) AS orders,
+                COUNT(*) AS items,
+                SUM(oi.sale_price) AS revenue
+            FROM `order_items` oi
+            JOIN `products` p ON p.id = oi.product_id
+            WHERE oi.created_at >= TIMESTAMP(since)
+            GROUP BY sale_date, category, status;
+            COMMIT TRANSACTION;
+        """,
+    ),
+    Rollup(
+        name="user_rfm_features",
+        description=(
+            "Rollup of order_items excluding Cancelled/Returned items: one row per user_id with "
+            "first_order_at, last_order_at, frequency (distinct orders) and monetary (SUM of sale_price). "
+            "Compute recency as DATE_DIFF(CURRENT_DATE(), DATE(last_order_at), DAY). Prefer it over "
+            "order_items for customer RFM segmentation, spend tiers and purchase-frequency questions."
+        ),
+        build_sql="""
+            CREATE OR REPLACE TABLE `{table}`
+            CLUSTER BY user_id AS
+            SELECT
+                oi.user_id AS user_id,
+                MIN(oi.created_at) AS first_order_at,
+                MAX(oi.created_at) AS last_order_at,
+                COUNT(DISTINCT oi.order_id) AS frequency,
+                SUM(oi.sale_price) AS monetary
+            FROM `order_items` oi
+            WHERE oi.status NOT IN ('Cancelled', 'Returned')
+            GROUP BY user_id
+        """,
+        # Statuses change after creation, so running totals cannot be merged additively:
+        # users with items in the trailing window are recomputed over their full history
+        refresh_sql="""
+            DECLARE since TIMESTAMP DEFAULT (
+                SELECT TIMESTAMP_SUB(
+                    IFNULL(MAX(last_order_at), TIMESTAMP '1970-01-01'), INTERVAL {restatement_days} DAY
+                )
+                FROM `{table}`
+            );
+            CREATE TEMP TABLE affected_users AS
+            SELECT DISTINCT oi.user_id AS user_id
+            FROM `order_items` oi
+            WHERE oi.created_at >= since;
+            BEGIN TRANSACTION;
+            DELETE FROM `{table}` WHERE user_id IN (SELECT user_id FROM affected_users);
+            INSERT INTO `{table}` (user_id, first_order_at, last_order_at, frequency, monetary)
+            SELECT
+                oi.user_id AS user_id,
+                MIN(oi.created_at) AS first_order_at,
+                MAX(oi.created_at) AS last_order_at,
+                COUNT(DISTINCT oi.order_id) AS frequency,
+                SUM(oi.sale_price) AS monetary
+            FROM `order_items` oi
+            WHERE oi.status NOT IN ('Cancelled', 'Returned')
+                AND oi.user_id IN (SELECT user_id FROM affected_users)
+            GROUP BY user_id;
+            COMMIT TRANSACTION;
+        """,
+    ),
+    Rollup(
+        name="monthly_cohort_counts",
+        description=(
+            "Rollup of orders joined to users: one row per cohort_month (month of user signup) and "
+            "activity_month (month of order) with active_users and orders. Prefer it over orders/users "
+            "for cohort retention and monthly active customer questions."
+        ),
+        build_sql="""
+            CREATE OR REPLACE TABLE `{table}` AS
+            SELECT
+                DATE_TRUNC(DATE(u.created_at), MONTH) AS cohort_month,
+                DATE_TRUNC(DATE(o.created_at), MONTH) AS activity_month,
+                COUNT(DISTINCT o.user_id) AS active_users,
+                COUNT(DISTINCT o.order_id) AS orders
+            FROM `orders` o
+            JOIN `users` u ON u.id = o.user_id
+            GROUP BY cohort_month, activity_month
+        """,
+        # Distinct counts are not additive, so the latest month is re-aggregated whole
+        refresh_sql="""
+            DECLARE since DATE DEFAULT (
+                SELECT IFNULL(MAX(activity_month), DATE '1970-01-01') FROM `{table}`
+            );
+            BEGIN TRANSACTION;
+            DELETE FROM `{table}` WHERE activity_month >= since;
+            INSERT INTO `{table}` (cohort_month, activity_month, active_users, orders)
+            SELECT
+                DATE_TRUNC(DATE(u.created_at), MONTH) AS cohort_month,
+                DATE_TRUNC(DATE(o.created_at), MONTH) AS activity_month,
+                COUNT(DISTINCT o.user_id) AS active_users,
+                COUNT(DISTINCT o.order_id) AS orders
+            FROM `orders` o
+            JOIN `users` u ON u.id = o.user_id
+            WHERE o.created_at >= TIMESTAMP(since)
+            GROUP BY cohort_month, activity_month;
+            COMMIT TRANSACTION;
+        """,
+    ),
+]
+
+
+class RollupManager:
+    """Maintains the rollup tables and exposes them to the SQL generators."""
+
+    def __init__(
+        self,
+        runner: BigQueryRunner,
+        rollup_dataset_id: str,
+        rollups: Optional[List[Rollup]] = None,
+    ) -> None:
+        """Initialize the rollup manager.
+
+        Args:
+            runner: BigQuery runner whose default dataset holds the source tables.
+            rollup_dataset_id: Writable dataset for the rollup tables ('dataset' or 'project.dataset').
+            rollups: Rollups to maintain. Defaults to ROLLUPS.
+        """
+        if "." not in rollup_dataset_id:
+            rollup_dataset_id = f"{runner.client.project}.{rollup_dataset_id}"
+        self.runner = runner
+        self.rollup_dataset_id = rollup_dataset_id
+        self.rollups = rollups if rollups is not None else ROLLUPS
+
+    def table_ref(self, rollup: Rollup) -> str:
+        """Return the fully-qualified table name of a rollup."""
+        return f"{self.rollup_dataset_id}.{rollup.name}"
+
+    def exists(self, rollup: Rollup) -> bool:
+        """Check whether a rollup table has been built."""
+        try:
+            self.runner.client.get_table(self.table_ref(rollup))
+            return True
+        except NotFound:
+            return False
+
+    def refresh(self, rollup: Rollup) -> None:
+        """Build a rollup if missing, otherwise refresh it incrementally.
+
+        Args:
+            rollup: The rollup to refresh.
+        """
+        if self.exists(rollup):
+            logging.info(f"Refreshing rollup {rollup.name} incrementally")
+            self.runner.execute_statement(
+                rollup.refresh_sql.format(
+                    table=self.table_ref(rollup),
+                    restatement_days=ROLLUP_RESTATEMENT_DAYS,
+                )
+            )
+        else:
+            logging.info(f"Building rollup {rollup.name}")
+            self.runner.execute_statement(
+                rollup.build_sql.format(table=self.table_ref(rollup))
+            )
+
+    def refresh_all(self) -> None:
+        """Build or incrementally refresh every rollup."""
+        for rollup in self.rollups:
+            self.refresh(rollup)
+
+    def schema(self) -> Dict[str, Dict[str, Any]]:
+        """Describe the built rollups in the same shape as the service's schema dict.
+
+        Returns:
+            Mapping of rollup name to its description and column schema.
+        """
+        schema = {}
+        for rollup in self.rollups:
+            try:
+                columns = self.runner.get_table_schema(
+                    rollup.name, dataset_id=self.rollup_dataset_id
+                )
+            except NotFound:
+                continue
+            schema[rollup.name] = {"description": rollup.description, "schema": columns}
+        return schema
+
+    def qualify(self, sql_query: str) -> str:
+        """Point FROM/JOIN references to rollups at the rollup dataset.
+
+        The SQL generators reference tables unqualified; rollups live outside the
+        default dataset, so their references are rewritten to the full table name.
+        Column references (e.g. EXTRACT(YEAR FROM user_rfm_features.last_order_at))
+        and longer table names sharing the prefix are left alone.
+
+        Args:
+            sql_query: Generated SQL query.
+
+        Returns:
+            The query with rollup table references fully qualified.
+        """
+        for rollup in self.rollups:
+            sql_query = re.sub(
+                rf"\b(FROM|JOIN)(\s+)`?(?:[\w-]+\.)*{rollup.name}`?(?=\s|[),;]|$)",
+                rf"\1\2`{self.table_ref(rollup)}`",
+                sql_query,
+                flags=re.IGNORECASE,
+            )
+        return sql_query
+
+
+def main():
+    """Build or incrementally refresh all rollups; run on a schedule (e.g. daily)."""
+    _ = load_dotenv()
+    rollup_dataset_id = os.getenv("ROLLUP_DATASET_ID")
+    if not rollup_dataset_id:
+        raise SystemExit("ROLLUP_DATASET_ID is not set")
+    runner = BigQueryRunner(
+        project_id=os.getenv("PROJECT_ID"), dataset_id=os.getenv("DATASET_ID")
+    )
+    RollupManager(runner, rollup_dataset_id).refresh_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,9 @@
 import os
 
 from dotenv import load_dotenv
+from langchain_core.exceptions import OutputParserException
 from langchain_google_genai import ChatGoogleGenerativeAI
+from pydantic import ValidationError
 
 from src.agents import (
     action_identifier,
@@ -15,6 +17,9 @@ from src.agents import (
     sql_generator_for_segmenation,
 )
 from src.big_query_runner import BigQueryRunner
+from src.follow_up import apply_follow_up, describe_result
+from src.rollups import RollupManager
+from src.time_series_cache import TimeSeriesCache
 from src.tools import UserActionType
 
 # Set-Up Environment
@@ -23,37 +28,234 @@ google_ai_api_key = os.getenv("GOOGLE_AI_API_KEY")
 project_id = os.getenv("PROJECT_ID")
 dataset_id = os.getenv("DATASET_ID")
 model_name = os.getenv("MODEL_NAME")
+# Fast tier: routing, chat refusals, metadata. Strong tier: SQL generation and narration.
+fast_model_name = os.getenv("FAST_MODEL_NAME") or model_name
+strong_model_name = os.getenv("STRONG_MODEL_NAME") or model_name
+# Writable dataset holding the rollup tables; unset disables rollups
+rollup_dataset_id = os.getenv("ROLLUP_DATASET_ID")
+# Sample percentage for approximate previews; unset disables preview mode
+preview_sample_percent = os.getenv("PREVIEW_SAMPLE_PERCENT")
 
-# Define Model
-model = ChatGoogleGenerativeAI(
-    model=model_name,
-    api_key=google_ai_api_key,
-    project=project_id,
-    vertexai=False,
-    temperature=0,
+# Define Models
+def build_model(name):
+    """
+    Builds a chat model for the given model name.
+    """
+    return ChatGoogleGenerativeAI(
+        model=name,
+        api_key=google_ai_api_key,
+        project=project_id,
+        vertexai=False,
+        temperature=0,
+    )
+
+
+fast_model = build_model(fast_model_name)
+strong_model = (
+    fast_model
+    if strong_model_name == fast_model_name
+    else build_model(strong_model_name)
 )
 
 # BigQuery Runner
 runner = BigQueryRunner(project_id=project_id, dataset_id=dataset_id)
+rollups = RollupManager(runner, rollup_dataset_id) if rollup_dataset_id else None
+time_series_cache = TimeSeriesCache(
+    runner, rewrite=rollups.qualify if rollups is not None else None
+)
+
+
+def with_escalation(agent, input):
+    """
+    Runs a structured-output agent on the fast model and escalates to the strong model
+    when the fast model's output fails to parse.
+    """
+    if fast_model is not strong_model:
+        try:
+            results = agent(fast_model, input)
+            if results is not None:
+                return results
+        except (OutputParserException, ValidationError):
+            pass
+    return agent(strong_model, input)
+
+
+def run_query(sql_query, session, query_parameters=None, allow_preview=False):
+    """
+    Executes a query and returns (execution, note).
+    When preview mode is enabled and the query reads a sampled table, a cheap approximate
+    query answers first (note states its error bounds) and the exact query keeps running
+    in the background; apply_refinement swaps it in once it finishes.
+    """
+    if rollups is not None:
+        sql_query = rollups.qualify(sql_query)
+    if (
+        allow_preview
+        and preview_sample_percent
+        and runner.is_previewable(sql_query)
+    ):
+        try:
+            preview = runner.execute_preview_query(
+                sql_query,
+                query_parameters,
+                sample_percent=float(preview_sample_percent),
+            )
+        except Exception:
+            preview = None  # Fall back to the exact query below
+        if preview is not None:
+            execution, note = preview
+            discard_refinement(session)
+            session["pending_exact"] = (
+                execution,
+                runner.submit_query(sql_query, query_parameters),
+            )
+            return execution, note
+    discard_refinement(session)
+    return runner.execute_query(sql_query, query_parameters), None
+
+
+def run_seasonality_query(sql_generation_results, session):
+    """
+    Executes a seasonality query and returns (execution, note).
+    Time-bucketed queries are served from the time-series cache, so repeated or extended
+    windows only query the missing and trailing buckets; anything else runs the generated SQL.
+    """
+    if sql_generation_results.time_series is not None:
+        try:
+            execution = time_series_cache.query(
+                sql_generation_results.time_series,
+                sql_generation_results.query_parameters,
+            )
+            discard_refinement(session)
+            return execution, None
+        except Exception:
+            pass  # Fall back to the generated SQL below
+    return run_query(
+        sql_generation_results.sql_query,
+        session,
+        sql_generation_results.query_parameters,
+        allow_preview=True,
+    )
+
+
+def apply_refinement(session, wait=False):
+    """
+    Replaces a preview result with the exact result once the background query is done.
+    The swap only happens while the preview is still the last result; otherwise the
+    exact result is no longer wanted and is dropped. With wait, blocks until the exact
+    query finishes, so a follow-up is applied to exact rows; if it fails, the preview
+    and its note are kept.
+    """
+    pending = session.get("pending_exact")
+    if pending is None:
+        return
+    preview, future = pending
+    if session.get("last_execution") is not preview:
+        discard_refinement(session)
+        return
+    if not wait and not future.done():
+        return
+    session.pop("pending_exact")
+    if future.exception() is None:
+        session["last_execution"] = future.result()
+        session["last_note"] = None
+
+
+def discard_refinement(session):
+    """
+    Drops a pending exact result, cancelling its query if it has not started yet.
+    """
+    pending = session.pop("pending_exact", None)
+    if pending is not None:
+        pending[1].cancel()
+
+
+def remember_result(session, execution, question, sql_query, note=None):
+    """
+    Stores a query result with the question and SQL that produced it, so follow-up
+    questions can tell which rows it holds, and the preview note while it is estimated.
+    """
+    session["last_execution"] = execution
+    session["last_note"] = note
+    session["last_source"] = {
+        "question": question,
+        "sql_query": sql_query,
+        "follow_ups": [],
+    }
+
+
+def with_preview_note(response, note):
+    """
+    Appends the preview error bounds to a response.
+    """
+    if note is None:
+        return response
+    return (
+        f"{response}\n\n({note} The exact result is computing in the background "
+        "and will be used for follow-up questions.)"
+    )
 
 
 # Service
-def data_analysis_service(human_message, chat_history=None):
+def data_analysis_service(human_message, chat_history=None, session=None):
     """
     Main service function for data analysis agent.
     Accepts a human_message and a chat_history (list of dicts with 'role' and 'content').
     Chat history is kept in memory for the session and can be used for context.
+    Session is a dict kept by the caller across turns; it holds the last query result
+    so follow-up questions can be answered without a new BigQuery job.
     """
     if chat_history is None:
         chat_history = []
+    if session is None:
+        session = {}
 
-    action_results = action_identifier(
-        model, {"query": human_message, "chat_history": chat_history}
+    apply_refinement(session)
+    previous = session.get("last_execution")
+    action_results = with_escalation(
+        action_identifier,
+        {
+            "query": human_message,
+            "chat_history": chat_history,
+            "previous_result": describe_result(previous, session.get("last_source")),
+        },
     )
 
+    if action_results.action_type == UserActionType.FOLLOW_UP:
+        execution = None
+        if previous is not None and action_results.follow_up is not None:
+            # Refine an estimated preview with the exact result before building on it
+            apply_refinement(session, wait=True)
+            previous = session.get("last_execution")
+            execution = apply_follow_up(
+                previous, action_results.follow_up, session.get("last_source")
+            )
+        if execution is not None:
+            source = session.get("last_source") or {
+                "question": action_results.action_description,
+                "sql_query": None,
+                "follow_ups": [],
+            }
+            session["last_execution"] = execution
+            session["last_source"] = {
+                **source,
+                "follow_ups": [*source["follow_ups"], action_results.follow_up],
+            }
+            return sql_answer(
+                strong_model,
+                {
+                    "question": action_results.action_description,
+                    "sql_results": execution,
+                    "result_note": session.get("last_note") or "None",
+                    "chat_history": chat_history,
+                },
+            )
+        # Previous result is not enough; answer it as a regular database query
+        action_results.action_type = UserActionType.DATABASE_QUERY
+
     if action_results.action_type == UserActionType.CHAT_INTERACTION:
         response = invalid_response_generator(
-            model,
+            fast_model,
             {"query": action_results.action_description, "chat_history": chat_history},
         )
     else:
@@ -77,6 +279,9 @@ def data_analysis_service(human_message, chat_history=None):
                         "schema": runner.get_table_schema("products"),
                     },
                 }
+                if rollups is not None:
+                    schema.update(rollups.schema())
+                break
             except:
                 return """
                     An error occurred while processing your request.
@@ -86,7 +291,7 @@ def data_analysis_service(human_message, chat_history=None):
             try:
                 if action_results.action_type == UserActionType.DATABASE_QUERY:
                     sql_generation_results = sql_generator(
-                        model,
+                        strong_model,
                         {
                             "question": action_results.action_description,
                             "schema": schema,
@@ -94,25 +299,39 @@ def data_analysis_service(human_message, chat_history=None):
                         },
                     )
                     try:
-                        execution = runner.execute_query(
-                            sql_query=sql_generation_results.sql_query
+                        # Only distinct-count questions are worth an approximate preview
+                        execution, note = run_query(
+                            sql_generation_results.sql_query,
+                            session,
+                            sql_generation_results.query_parameters,
+                            allow_preview="COUNT(DISTINCT"
+                            in sql_generation_results.sql_query.upper(),
                         )
                     except:
                         return """
                             An error occurred while processing your request.
                             Please try again!
                         """
+                    remember_result(
+                        session,
+                        execution,
+                        action_results.action_description,
+                        sql_generation_results.sql_query,
+                        note,
+                    )
                     response = sql_answer(
-                        model,
+                        strong_model,
                         {
                             "question": action_results.action_description,
                             "sql_results": execution,
+                            "result_note": note or "None",
                             "chat_history": chat_history,
                         },
                     )
+                    response = with_preview_note(response, note)
                 elif action_results.action_type == UserActionType.SCHEMA_METADATA:
                     response = metadata_response_generator(
-                        model,
+                        fast_model,
                         {
                             "query": action_results.action_description,
                             "schema": schema,
@@ -121,7 +340,7 @@ def data_analysis_service(human_message, chat_history=None):
                     )
                 elif action_results.action_type == UserActionType.SEGMENTATION:
                     sql_generation_results = sql_generator_for_segmenation(
-                        model,
+                        strong_model,
                         {
                             "question": action_results.action_description,
                             "schema": schema,
@@ -129,16 +348,25 @@ def data_analysis_service(human_message, chat_history=None):
                         },
                     )
                     try:
-                        execution = runner.execute_query(
-                            sql_query=sql_generation_results.sql_query
+                        execution, note = run_query(
+                            sql_generation_results.sql_query,
+                            session,
+                            sql_generation_results.query_parameters,
                         )
                     except:
                         return """
                             An error occurred while processing your request.
                             Please try again!
                         """
+                    remember_result(
+                        session,
+                        execution,
+                        action_results.action_description,
+                        sql_generation_results.sql_query,
+                        note,
+                    )
                     response = sql_answer_for_segmenation(
-                        model,
+                        strong_model,
                         {
                             "question": action_results.action_description,
                             "table": execution,
@@ -150,7 +378,7 @@ def data_analysis_service(human_message, chat_history=None):
                     == UserActionType.SEASONALITY_TRENDS_PATTERNS
                 ):
                     sql_generation_results = sql_generator_for_seasonality(
-                        model,
+                        strong_model,
                         {
                             "question": action_results.action_description,
                             "schema": schema,
@@ -158,22 +386,32 @@ def data_analysis_service(human_message, chat_history=None):
                         },
                     )
                     try:
-                        execution = runner.execute_query(
-                            sql_query=sql_generation_results.sql_query
+                        execution, note = run_seasonality_query(
+                            sql_generation_results, session
                         )
                     except:
                         return """
                             An error occurred while processing your request.
                             Please try again!
                         """
+                    remember_result(
+                        session,
+                        execution,
+                        action_results.action_description,
+                        sql_generation_results.sql_query,
+                        note,
+                    )
                     response = sql_answer_for_seasonality(
-                        model,
+                        strong_model,
                         {
                             "question": action_results.action_description,
                             "table": execution,
+                            "result_note": note or "None",
                             "chat_history": chat_history,
                         },
                     )
+                    response = with_preview_note(response, note)
+                break  # Each pass regenerates and re-runs the SQL; stop after a success
             except:
                 return """
                     An error occurred while processing your request.
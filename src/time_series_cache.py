@@ -0,0 +1,253 @@
+import logging
+import re
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable, Hashable, List, Optional, Tuple
+
+import pandas as pd
+
+from src.big_query_runner import BigQueryRunner
+from src.result_store import SpilledResult, accountant
+from src.tools import (
+    QueryParameter,
+    QueryParameterType,
+    TimeGrain,
+    TimeSeriesSpec,
+)
+
+# Name of the bucket column in cached results
+TIME_PERIOD = "time_period"
+
+# Columns whose values change after a row is created (e.g. Complete -> Returned).
+# Past buckets computed from them are not final, so such series are not cached.
+MUTABLE_COLUMNS = ("status", "returned_at", "shipped_at", "delivered_at")
+
+
+def _normalize(text: Optional[str]) -> str:
+    """Collapse whitespace so formatting differences do not split cache entries."""
+    return " ".join((text or "").split())
+
+
+def bucket_start(day: date, grain: TimeGrain) -> date:
+    """Return the first day of the bucket containing day (matches BigQuery DATE_TRUNC)."""
+    if grain == TimeGrain.WEEK:
+        return day - timedelta(days=(day.weekday() + 1) % 7)
+    if grain == TimeGrain.MONTH:
+        return day.replace(day=1)
+    if grain == TimeGrain.QUARTER:
+        return day.replace(month=3 * ((day.month - 1) // 3) + 1, day=1)
+    if grain == TimeGrain.YEAR:
+        return day.replace(month=1, day=1)
+    return day
+
+
+def next_bucket(start: date, grain: TimeGrain) -> date:
+    """Return the first day of the bucket after the one starting at start."""
+    if grain == TimeGrain.DAY:
+        return start + timedelta(days=1)
+    if grain == TimeGrain.WEEK:
+        return start + timedelta(days=7)
+    months = {TimeGrain.MONTH: 1, TimeGrain.QUARTER: 3, TimeGrain.YEAR: 12}[grain]
+    month = start.month - 1 + months
+    return start.replace(year=start.year + month // 12, month=month % 12 + 1, day=1)
+
+
+def _expressions(spec: TimeSeriesSpec) -> List[str]:
+    """Return the SQL fragments of a spec that read source rows."""
+    expressions = [spec.from_clause, spec.filter_clause or ""]
+    expressions += [m.expression for m in spec.metrics]
+    expressions += [d.expression for d in spec.dimensions]
+    return expressions
+
+
+def used_parameters(
+    spec: TimeSeriesSpec, query_parameters: List[QueryParameter]
+) -> List[QueryParameter]:
+    """Return the query parameters the spec's SQL fragments reference as @name.
+
+    Parameters the generator bound for its own date window are not used by the
+    spec (its window is start_date/end_date), so they must not split cache entries.
+    """
+    text = " ".join(_expressions(spec))
+    return [
+        p for p in query_parameters if re.search(rf"@{re.escape(p.name)}\b", text)
+    ]
+
+
+def check_cacheable(spec: TimeSeriesSpec) -> None:
+    """Raise ValueError if the series reads a column whose past values can change."""
+    expressions = _expressions(spec)
+    for column in MUTABLE_COLUMNS:
+        if any(re.search(rf"\b{column}\b", text, re.IGNORECASE) for text in expressions):
+            raise ValueError(f"Time series reads mutable column {column}")
+
+
+class TimeSeriesCache:
+    """Per-bucket cache of time-series aggregates over append-only tables.
+
+    Entries are keyed by (from clause, timestamp column, grain, metrics, dimensions,
+    filter, values of the parameters these reference) and cover a contiguous range
+    of buckets. Repeated or extended requests only query the buckets before the
+    cached range and from the current (still changing) bucket onward, then merge
+    them locally.
+
+    Buckets before the current one are treated as final, which only holds for
+    append-only data. Series whose from clause (including join conditions), filter,
+    metrics or dimensions read a column in MUTABLE_COLUMNS are rejected, as are
+    windows that do not start and end on bucket boundaries (a partial first or
+    last bucket would not match the cache).
+    """
+
+    def __init__(
+        self,
+        runner: BigQueryRunner,
+        max_entries: int = 32,
+        rewrite: Optional[Callable[[str], str]] = None,
+    ) -> None:
+        """Initialize the cache.
+
+        Args:
+            runner: BigQuery runner used for delta queries.
+            max_entries: Number of time series kept. Least recently used entries are
+                evicted beyond it and while tracked result frames exceed the memory limit.
+            rewrite: Optional rewrite applied to each generated SQL query before execution.
+        """
+        self.runner = runner
+        self.max_entries = max_entries
+        self.rewrite = rewrite
+        self._entries: "OrderedDict[Hashable, Tuple[date, date, pd.DataFrame]]" = (
+            OrderedDict()
+        )
+
+    @staticmethod
+    def key(
+        spec: TimeSeriesSpec, query_parameters: List[QueryParameter]
+    ) -> Tuple[Hashable, ...]:
+        """Build the cache key of a time series; the window is not part of it."""
+        return (
+            _normalize(spec.from_clause),
+            _normalize(spec.timestamp_column),
+            str(spec.grain),
+            tuple((_normalize(m.expression), m.alias) for m in spec.metrics),
+            tuple((_normalize(d.expression), d.alias) for d in spec.dimensions),
+            _normalize(spec.filter_clause),
+            tuple(
+                sorted(
+                    (p.name, str(p.type), p.value, tuple(p.values or ()))
+                    for p in query_parameters
+                )
+            ),
+        )
+
+    def query(
+        self,
+        spec: TimeSeriesSpec,
+        query_parameters: Optional[List[QueryParameter]] = None,
+        today: Optional[date] = None,
+    ) -> pd.DataFrame:
+        """Return the time series for the spec's window, querying only missing buckets.
+
+        Args:
+            spec: Structured time-series query.
+            query_parameters: Values for @params; only those the spec references are used.
+            today: Current date; defaults to the current UTC date, matching BigQuery DATE().
+
+        Returns:
+            DataFrame with a time_period column, the dimensions and the metrics.
+
+        Raises:
+            ValueError: If the spec cannot be cached (mutable columns, unaligned window).
+            Exception: If a delta query fails.
+        """
+        query_parameters = used_parameters(spec, query_parameters or [])
+        today = today or datetime.now(timezone.utc).date()
+        check_cacheable(spec)
+        start = date.fromisoformat(spec.start_date)
+        if start != bucket_start(start, spec.grain):
+            raise ValueError(f"start_date {start} is not the start of a {spec.grain} bucket")
+        if spec.end_date:
+            end = date.fromisoformat(spec.end_date)
+            if end != bucket_start(end, spec.grain):
+                raise ValueError(f"end_date {end} is not the start of a {spec.grain} bucket")
+        else:
+            end = next_bucket(bucket_start(today, spec.grain), spec.grain)
+        # Buckets from the current one onward may still receive rows
+        stable_end = bucket_start(today, spec.grain)
+
+        key = self.key(spec, query_parameters)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            cached_start, cached_end, df = self._entries[key]
+            cached_end = min(cached_end, stable_end)
+            frames = []
+            if start < cached_start:
+                frames.append(self._fetch(spec, query_parameters, start, cached_start))
+                cached_start = start
+            if end > cached_end:
+                df = df[df[TIME_PERIOD] < pd.Timestamp(cached_end)]
+                frames.append(self._fetch(spec, query_parameters, cached_end, end))
+                cached_end = end
+            if frames:
+                df = pd.concat([df, *frames], ignore_index=True)
+            else:
+                logging.info("Time series served from cache")
+        else:
+            cached_start, cached_end = start, end
+            df = self._fetch(spec, query_parameters, start, end)
+
+        df = accountant.track(df.sort_values(TIME_PERIOD, ignore_index=True))
+        self._entries[key] = (cached_start, cached_end, df)
+        while len(self._entries) > self.max_entries or (
+            accountant.over_limit() and len(self._entries) > 1
+        ):
+            self._entries.popitem(last=False)
+
+        window = (df[TIME_PERIOD] >= pd.Timestamp(start)) & (
+            df[TIME_PERIOD] < pd.Timestamp(end)
+        )
+        return accountant.track(df[window].reset_index(drop=True))
+
+    def _fetch(
+        self,
+        spec: TimeSeriesSpec,
+        query_parameters: List[QueryParameter],
+        start: date,
+        end: date,
+    ) -> pd.DataFrame:
+        """Query the buckets in [start, end) from BigQuery."""
+        logging.info(f"Querying time series buckets from {start} to {end}")
+        select = [f"DATE_TRUNC(DATE({spec.timestamp_column}), {spec.grain}) AS {TIME_PERIOD}"]
+        select += [f"{d.expression} AS {d.alias}" for d in spec.dimensions]
+        select += [f"{m.expression} AS {m.alias}" for m in spec.metrics]
+        where = [
+            f"DATE({spec.timestamp_column}) >= @ts_window_start",
+            f"DATE({spec.timestamp_column}) < @ts_window_end",
+        ]
+        if spec.filter_clause:
+            where.append(f"({spec.filter_clause})")
+        group_by = [TIME_PERIOD] + [d.alias for d in spec.dimensions]
+        sql_query = (
+            f"SELECT {', '.join(select)} "
+            f"FROM {spec.from_clause} "
+            f"WHERE {' AND '.join(where)} "
+            f"GROUP BY {', '.join(group_by)}"
+        )
+        if self.rewrite is not None:
+            sql_query = self.rewrite(sql_query)
+        window = [
+            QueryParameter(
+                name="ts_window_start", type=QueryParameterType.DATE, value=start.isoformat()
+            ),
+            QueryParameter(
+                name="ts_window_end", type=QueryParameterType.DATE, value=end.isoformat()
+            ),
+        ]
+        # Trailing buckets change between calls, so bypass the runner's result cache
+        df = self.runner.execute_query(
+            sql_query, query_parameters + window, use_cache=False
+        )
+        if isinstance(df, SpilledResult):
+            raise MemoryError("Time series too large to cache in memory")
+        df = df.copy()
+        df[TIME_PERIOD] = pd.to_datetime(df[TIME_PERIOD])
+        return df
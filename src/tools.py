@@ -1,4 +1,5 @@
 from enum import StrEnum
+from typing import List, Optional
 
 from pydantic import BaseModel, Field
 
@@ -13,6 +14,77 @@ class UserActionType(StrEnum):
     SEGMENTATION = "segmentation"
     SEASONALITY_TRENDS_PATTERNS = "seasonality_trends_patterns"
     SCHEMA_METADATA = "schema_metadata"
+    FOLLOW_UP = "follow_up"
+
+
+class AggregationFunction(StrEnum):
+    """
+    Enumeration of aggregations that can be re-applied locally to a previous result.
+    """
+
+    SUM = "sum"
+    MEAN = "mean"
+    MEDIAN = "median"
+    MIN = "min"
+    MAX = "max"
+    COUNT = "count"
+    NUNIQUE = "nunique"
+
+
+class ColumnAggregation(BaseModel):
+    """
+    A single aggregation over one column of the previous result.
+    """
+
+    column: str = Field(description="Column of the previous result to aggregate.")
+    function: AggregationFunction = Field(description="Aggregation to apply.")
+    alias: Optional[str] = Field(
+        default=None,
+        description="Output column name. Defaults to '<function>_<column>'.",
+    )
+
+
+class FollowUpTransform(BaseModel):
+    """
+    Describes how to derive the answer to a follow-up question from the previous result.
+
+    The steps are applied in order: filter, group/aggregate, sort, column selection, limit.
+    Every field is optional; leave a field empty when the step is not needed.
+    """
+
+    filter_expression: Optional[str] = Field(
+        default=None,
+        description=(
+            """
+            A pandas DataFrame.query expression over the previous result's columns.
+            Use backticks for column names with spaces. Examples:
+            - 'order_year == 2024'
+            - 'revenue > 1000 and country == "Brazil"'
+            """
+        ),
+    )
+    group_by: List[str] = Field(
+        default_factory=list,
+        description="Columns to group by before aggregating. Empty means no grouping.",
+    )
+    aggregations: List[ColumnAggregation] = Field(
+        default_factory=list,
+        description="Aggregations to compute. Empty means no re-aggregation.",
+    )
+    sort_by: List[str] = Field(
+        default_factory=list,
+        description="Columns (or aggregation aliases) to sort by.",
+    )
+    ascending: bool = Field(
+        default=False, description="Sort direction. False sorts descending."
+    )
+    columns: List[str] = Field(
+        default_factory=list,
+        description="Columns to keep in the final result. Empty keeps all columns.",
+    )
+    limit: Optional[int] = Field(
+        default=None, description="Maximum number of rows to keep (e.g. 'top 5')."
+    )
 
 
 class UserAction(BaseModel):
@@ -51,10 +123,129 @@ class UserAction(BaseModel):
             product performance/recommendations, trends/seasonality, geographic patterns.
             - 'seasonality_trends_patterns': advanced analytics focused on time-based insights such as
             trends, seasonality, cycles, peaks/troughs, and anomalies.
+            - 'follow_up': a follow-up on the previous result (filter, sort, top N, re-aggregate) that can be
+            answered using ONLY the columns of the previous result.
             """
         )
     )
 
+    follow_up: Optional[FollowUpTransform] = Field(
+        default=None,
+        description=(
+            """
+            Required when action_type is 'follow_up', otherwise leave empty.
+            The transform to apply to the previous result to answer the question.
+            """
+        ),
+    )
+
+
+class QueryParameterType(StrEnum):
+    """
+    Enumeration of BigQuery types supported for query parameters.
+    """
+
+    STRING = "STRING"
+    INT64 = "INT64"
+    FLOAT64 = "FLOAT64"
+    NUMERIC = "NUMERIC"
+    BOOL = "BOOL"
+    DATE = "DATE"
+    DATETIME = "DATETIME"
+    TIMESTAMP = "TIMESTAMP"
+
+
+class QueryParameter(BaseModel):
+    """
+    A named, typed BigQuery query parameter referenced as @name in the SQL.
+    Values are written as strings and converted to the declared type before binding.
+    """
+
+    name: str = Field(description="Parameter name without the leading '@'.")
+    type: QueryParameterType = Field(
+        description="BigQuery type of the value (or of each array element)."
+    )
+    value: Optional[str] = Field(
+        default=None,
+        description=(
+            "Scalar value as a string, e.g. '2024-01-01', '100', 'true', 'Brazil'. "
+            "Leave empty for array parameters."
+        ),
+    )
+    values: Optional[List[str]] = Field(
+        default=None,
+        description=(
+            "Array values as strings, for use with IN UNNEST(@name). "
+            "Leave empty for scalar parameters."
+        ),
+    )
+
+
+class TimeGrain(StrEnum):
+    """
+    Enumeration of time bucket sizes (BigQuery DATE_TRUNC parts; weeks start on Sunday).
+    """
+
+    DAY = "DAY"
+    WEEK = "WEEK"
+    MONTH = "MONTH"
+    QUARTER = "QUARTER"
+    YEAR = "YEAR"
+
+
+class SelectExpression(BaseModel):
+    """
+    A SQL expression with its output alias.
+    """
+
+    expression: str = Field(
+        description="BigQuery SQL expression, e.g. 'COUNT(DISTINCT o.order_id)' or 'p.category'."
+    )
+    alias: str = Field(description="Output column name.")
+
+
+class TimeSeriesSpec(BaseModel):
+    """
+    Structured description of a time-bucketed aggregate query.
+    Lets seasonality results be cached per bucket so repeated or extended requests only
+    query the missing or trailing buckets.
+    """
+
+    from_clause: str = Field(
+        description=(
+            "Everything after FROM, without the WHERE clause, e.g. "
+            "'`orders` o JOIN `users` u ON u.id = o.user_id'."
+        )
+    )
+    timestamp_column: str = Field(
+        description="Timestamp or date column that defines the time buckets, e.g. 'o.created_at'."
+    )
+    grain: TimeGrain = Field(description="Time bucket size.")
+    metrics: List[SelectExpression] = Field(
+        description="Aggregate expressions computed per bucket, e.g. COUNT(DISTINCT o.order_id)."
+    )
+    dimensions: List[SelectExpression] = Field(
+        default_factory=list,
+        description="Optional non-aggregated grouping expressions, e.g. p.category.",
+    )
+    filter_clause: Optional[str] = Field(
+        default=None,
+        description=(
+            "Optional WHERE condition excluding the time window, e.g. \"o.status = @status\". "
+            "May reference @params declared in query_parameters."
+        ),
+    )
+    start_date: str = Field(
+        description="First date of the window as YYYY-MM-DD; must be the first day of a bucket."
+    )
+    end_date: Optional[str] = Field(
+        default=None,
+        description=(
+            "Exclusive end date as YYYY-MM-DD; must be the first day of a bucket. "
+            "Leave empty to include up to today."
+        ),
+    )
+
 
 class SQLAction(BaseModel):
     """
@@ -73,3 +264,17 @@ class SQLAction(BaseModel):
             "prefer fully-qualified tables like `project.dataset.table`, and do not include markdown fences."
         )
     )
+    query_parameters: List[QueryParameter] = Field(
+        default_factory=list,
+        description=(
+            "Every @name parameter referenced in sql_query, with its type and value. "
+            "Use parameters for user-provided literals (dates, thresholds, names, lists)."
+        ),
+    )
+    time_series: Optional[TimeSeriesSpec] = Field(
+        default=None,
+        description=(
+            "Only for time-bucketed trend queries: the same query in structured form. "
+            "Leave empty when the query is not a plain per-bucket aggregate."
+        ),
+    )
@@ -0,0 +1,224 @@
+import pandas as pd
+import pyarrow as pa
+import pytest
+from google.cloud import bigquery
+
+from src import big_query_runner
+from src.big_query_runner import (
+    HLL_RELATIVE_ERROR,
+    BigQueryRunner,
+    _scale_additive_aggregates,
+)
+from src.tools import QueryParameter
+
+
+def test_scale_additive_aggregates_wraps_count_countif_and_sum():
+    sql = "SELECT COUNT(*) AS n, COUNTIF(oi.status = 'Complete') AS c, SUM(IF(a, 1, 0)) AS s FROM t"
+
+    assert _scale_additive_aggregates(sql, 10) == (
+        "SELECT (COUNT(*) * 10) AS n, (COUNTIF(oi.status = 'Complete') * 10) AS c, "
+        "(SUM(IF(a, 1, 0)) * 10) AS s FROM t"
+    )
+
+
+def test_scale_additive_aggregates_skips_analytic_calls_and_other_aggregates():
+    sql = "SELECT SUM(x) OVER (PARTITION BY y) AS running, AVG(x) AS mean, MAX(x) AS top FROM t"
+
+    assert _scale_additive_aggregates(sql, 10) == sql
+
+
+def test_scale_additive_aggregates_scales_each_value_once():
+    # The analytic SUM totals already-scaled counts; the outer SUM covers the inner COUNT
+    sql = "SELECT SUM(COUNT(*)) OVER () AS total, SUM(x + COUNT(y)) AS s FROM t"
+
+    assert _scale_additive_aggregates(sql, 5) == (
+        "SELECT SUM((COUNT(*) * 5)) OVER () AS total, (SUM(x + COUNT(y)) * 5) AS s FROM t"
+    )
+
+
+def test_approximate_query_uses_hll_without_sampling_for_distinct_counts():
+    sql = (
+        "SELECT DATE_TRUNC(DATE(oi.created_at), WEEK) AS week, COUNT(DISTINCT oi.order_id) AS orders "
+        "FROM `order_items` oi GROUP BY week"
+    )
+
+    approximate, note = BigQueryRunner.approximate_query(sql, 10)
+
+    assert approximate == (
+        "SELECT DATE_TRUNC(DATE(oi.created_at), WEEK) AS week, APPROX_COUNT_DISTINCT(oi.order_id) AS orders "
+        "FROM `order_items` oi GROUP BY week"
+    )
+    assert "TABLESAMPLE" not in approximate
+    assert f"{HLL_RELATIVE_ERROR:.1%}" in note
+
+
+def test_approximate_query_samples_and_scales_single_block_aggregates():
+    sql = (
+        "SELECT DATE_TRUNC(DATE(oi.created_at), WEEK) AS week, COUNTIF(oi.status = 'Returned') AS returns, "
+        "SUM(oi.sale_price) AS revenue FROM `order_items` AS oi WHERE oi.sale_price > 0 GROUP BY week"
+    )
+
+    approximate, note = BigQueryRunner.approximate_query(sql, 10)
+
+    assert approximate == (
+        "SELECT DATE_TRUNC(DATE(oi.created_at), WEEK) AS week, (COUNTIF(oi.status = 'Returned') * 10) AS returns, "
+        "(SUM(oi.sale_price) * 10) AS revenue FROM `order_items` AS oi TABLESAMPLE SYSTEM (10 PERCENT) "
+        "WHERE oi.sale_price > 0 GROUP BY week"
+    )
+    assert "scaled up by 10x" in note
+
+
+@pytest.mark.parametrize(
+    "sql",
+    [
+        "SELECT COUNT(*) AS n FROM `project.dataset.order_items` oi JOIN `products` p ON p.id = oi.product_id",
+        "SELECT COUNT(*) AS n FROM order_items",
+        "SELECT COUNT(*) AS n FROM dataset.order_items GROUP BY 1",
+    ],
+)
+def test_approximate_query_samples_qualified_unaliased_and_trailing_tables(sql):
+    approximate, _ = BigQueryRunner.approximate_query(sql, 10)
+
+    assert approximate.count("TABLESAMPLE SYSTEM (10 PERCENT)") == 1
+    assert "(COUNT(*) * 10)" in approximate
+
+
+def test_approximate_query_ignores_column_references_to_the_table():
+    sql = (
+        "SELECT EXTRACT(YEAR FROM order_items.created_at) AS year, SUM(order_items.sale_price) AS revenue "
+        "FROM order_items GROUP BY year"
+    )
+
+    approximate, _ = BigQueryRunner.approximate_query(sql, 10)
+
+    assert "EXTRACT(YEAR FROM order_items.created_at)" in approximate
+    assert approximate.endswith("FROM order_items TABLESAMPLE SYSTEM (10 PERCENT) GROUP BY year")
+
+
+@pytest.mark.parametrize(
+    "sql",
+    [
+        # CTEs and subqueries cannot be scaled reliably
+        "WITH w AS (SELECT oi.user_id, SUM(oi.sale_price) AS s FROM `order_items` oi GROUP BY 1) "
+        "SELECT COUNT(*) FROM w",
+        "SELECT COUNT(*) FROM (SELECT * FROM order_items) x",
+        # Nothing to scale
+        "SELECT oi.order_id FROM order_items oi LIMIT 10",
+        # Sampled table not read
+        "SELECT COUNT(*) FROM orders o",
+        # Rows of unsampled tables would be scaled
+        "SELECT COUNT(u.id) AS n FROM users u LEFT JOIN order_items oi ON oi.user_id = u.id",
+        "SELECT COUNT(*) AS n FROM users u JOIN `order_items` oi ON oi.user_id = u.id",
+        "SELECT COUNT(*) AS n FROM order_items oi RIGHT OUTER JOIN users u ON oi.user_id = u.id",
+        "SELECT COUNT(*) FROM order_items UNION ALL SELECT COUNT(*) FROM orders",
+    ],
+)
+def test_approximate_query_declines_queries_it_cannot_scale(sql):
+    assert BigQueryRunner.approximate_query(sql, 10) is None
+
+
+def test_is_previewable_requires_a_table_reference():
+    assert BigQueryRunner.is_previewable("SELECT 1 FROM `order_items` oi")
+    assert not BigQueryRunner.is_previewable(
+        "SELECT EXTRACT(YEAR FROM order_items.created_at) FROM orders"
+    )
+
+
+class _StubRows:
+    total_rows = 0
+
+    def to_dataframe(self):
+        return pd.DataFrame({"n": [1]})
+
+
+class _StubJob:
+    def result(self, page_size=None):
+        return _StubRows()
+
+
+class _StubClient:
+    def __init__(self):
+        self.queries = []
+
+    def query(self, sql_query, job_config=None):
+        self.queries.append(sql_query)
+        return _StubJob()
+
+
+@pytest.fixture
+def runner(monkeypatch):
+    monkeypatch.setattr(bigquery, "Client", lambda **kwargs: _StubClient())
+    return BigQueryRunner(project_id="project", dataset_id="project.dataset")
+
+
+def test_execute_query_caches_by_template_and_parameter_values(runner):
+    sql = "SELECT COUNT(*) AS n FROM orders WHERE status = @status"
+    complete = [QueryParameter(name="status", type="STRING", value="Complete")]
+    returned = [QueryParameter(name="status", type="STRING", value="Returned")]
+
+    runner.execute_query(sql, complete)
+    runner.execute_query("  " + sql.replace(" ", "\n"), complete)
+    runner.execute_query(sql, returned)
+
+    assert len(runner.client.queries) == 2
+
+
+def test_execute_query_does_not_cache_non_deterministic_sql(runner):
+    sql = "SELECT COUNT(*) AS n FROM orders WHERE created_at >= TIMESTAMP(CURRENT_DATE())"
+
+    runner.execute_query(sql)
+    runner.execute_query(sql)
+
+    assert len(runner.client.queries) == 2
+
+
+def test_execute_query_expires_cached_results(runner, monkeypatch):
+    sql = "SELECT COUNT(*) AS n FROM orders"
+    now = [1000.0]
+    monkeypatch.setattr(big_query_runner.time, "monotonic", lambda: now[0])
+
+    runner.execute_query(sql)
+    now[0] += big_query_runner.RESULT_CACHE_TTL_SECONDS - 1
+    runner.execute_query(sql)
+    now[0] += 2
+    runner.execute_query(sql)
+
+    assert len(runner.client.queries) == 2
+
+
+def test_execute_query_evicts_cache_while_over_memory_limit(runner, monkeypatch):
+    monkeypatch.setattr(big_query_runner.accountant, "over_limit", lambda: True)
+
+    runner.execute_query("SELECT COUNT(*) AS n FROM orders")
+    runner.execute_query("SELECT COUNT(*) AS n FROM users")
+    runner.execute_query("SELECT COUNT(*) AS n FROM orders")
+
+    # Only the newest result stays cached while tracked frames exceed the limit
+    assert len(runner._result_cache) == 1
+    assert len(runner.client.queries) == 3
+
+
+def test_execute_query_streams_through_bounded_storage_api_reads(runner, monkeypatch):
+    calls = []
+
+    class _Rows:
+        total_rows = 2
+
+        def to_arrow_iterable(self, **kwargs):
+            calls.append(kwargs)
+            return iter([pa.RecordBatch.from_pydict({"n": [1, 2]})])
+
+    storage = object()
+    monkeypatch.setattr(_StubJob, "result", lambda self, page_size=None: _Rows())
+    monkeypatch.setattr(runner, "bqstorage_client", lambda: storage)
+
+    df = runner.execute_query("SELECT n FROM orders")
+
+    assert df["n"].tolist() == [1, 2]
+    assert calls == [
+        {
+            "bqstorage_client": storage,
+            "max_queue_size": big_query_runner.RESULT_STREAM_COUNT,
+            "max_stream_count": big_query_runner.RESULT_STREAM_COUNT,
+        }
+    ]
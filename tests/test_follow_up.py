@@ -0,0 +1,120 @@
+import pandas as pd
+import pytest
+
+from src.follow_up import apply_follow_up, describe_result, is_safe_filter
+from src.tools import ColumnAggregation, FollowUpTransform
+
+COLUMNS = ["order_year", "category", "revenue", "order count"]
+
+
+@pytest.mark.parametrize(
+    "expression",
+    [
+        "order_year == 2024",
+        "revenue > 10 and category != 'Jeans'",
+        "category in ['Jeans', 'Tops']",
+        "not (revenue < -5)",
+        "`order count` >= 3",
+    ],
+)
+def test_is_safe_filter_accepts_column_comparisons(expression):
+    assert is_safe_filter(expression, COLUMNS)
+
+
+@pytest.mark.parametrize(
+    "expression",
+    [
+        "category.to_csv('/tmp/x') == category.to_csv('/tmp/x')",
+        "revenue.__class__ == 1",
+        "revenue == @threshold",
+        "missing == 1",
+        "`missing column` == 1",
+        "revenue + 1 > 2",
+        "revenue[0] == 1",
+        "revenue ==",
+    ],
+)
+def test_is_safe_filter_rejects_other_expressions(expression):
+    assert not is_safe_filter(expression, COLUMNS)
+
+
+def test_apply_follow_up_filters_aggregates_sorts_and_limits():
+    previous = pd.DataFrame(
+        {
+            "order_year": [2023, 2024, 2024, 2024],
+            "category": ["a", "a", "b", "b"],
+            "revenue": [1, 2, 3, 4],
+        }
+    )
+    transform = FollowUpTransform(
+        filter_expression="order_year == 2024",
+        group_by=["category"],
+        aggregations=[ColumnAggregation(column="revenue", function="sum", alias="total")],
+        sort_by=["total"],
+        limit=1,
+    )
+
+    result = apply_follow_up(previous, transform)
+
+    assert result.to_dict("records") == [{"category": "b", "total": 7}]
+
+
+def test_apply_follow_up_rejects_unsafe_filter_without_running_it(tmp_path):
+    target = tmp_path / "x.csv"
+    previous = pd.DataFrame({"revenue": [1, 2]})
+    transform = FollowUpTransform(
+        filter_expression=f"revenue.to_csv('{target}') == revenue.to_csv('{target}')"
+    )
+
+    assert apply_follow_up(previous, transform) is None
+    assert not target.exists()
+
+
+def test_apply_follow_up_returns_none_for_missing_columns():
+    previous = pd.DataFrame({"revenue": [1, 2]})
+    transform = FollowUpTransform(group_by=["country"])
+
+    assert apply_follow_up(previous, transform) is None
+
+
+def test_apply_follow_up_returns_none_when_filter_leaves_no_rows():
+    previous = pd.DataFrame({"order_year": [2024, 2024], "revenue": [1, 2]})
+    transform = FollowUpTransform(filter_expression="order_year == 2023")
+
+    assert apply_follow_up(previous, transform) is None
+
+
+def test_apply_follow_up_rejects_non_additive_reaggregation_of_aggregated_rows():
+    previous = pd.DataFrame({"category": ["a", "b"], "avg_price": [10.0, 30.0]})
+    source = {
+        "question": "Average price per category",
+        "sql_query": "SELECT category, AVG(sale_price) AS avg_price FROM order_items GROUP BY category",
+        "follow_ups": [],
+    }
+    mean = FollowUpTransform(
+        aggregations=[ColumnAggregation(column="avg_price", function="mean")]
+    )
+    top = FollowUpTransform(
+        aggregations=[ColumnAggregation(column="avg_price", function="max", alias="top")]
+    )
+
+    assert apply_follow_up(previous, mean, source) is None
+    assert apply_follow_up(previous, mean) is not None
+    assert apply_follow_up(previous, top, source).to_dict("records") == [{"top": 30.0}]
+
+
+def test_describe_result_states_question_sql_limit_and_aggregation():
+    previous = pd.DataFrame({"user_id": [1, 2], "orders": [5, 4]})
+    source = {
+        "question": "Top users by orders",
+        "sql_query": "SELECT user_id, COUNT(*) AS orders FROM orders GROUP BY user_id LIMIT 20",
+        "follow_ups": [FollowUpTransform(limit=2)],
+    }
+
+    description = describe_result(previous, source)
+
+    assert "Answers: Top users by orders" in description
+    assert "LIMIT 20" in description
+    assert "Limited to 2 rows" in description
+    assert "already aggregated" in description
+    assert describe_result(previous).startswith("2 rows with columns")
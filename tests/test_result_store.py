@@ -0,0 +1,79 @@
+import gc
+from datetime import date
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from src import result_store
+from src.result_store import SpilledResult, accountant, collect_batches
+
+
+def _batches(count, rows=1000):
+    return [
+        pa.RecordBatch.from_pydict(
+            {
+                "id": pa.array([i * rows + j for j in range(rows)], pa.int64()),
+                "qty": pa.array([None if j % 2 else j for j in range(rows)], pa.int64()),
+                "day": pa.array([date(2024, 1, 1)] * rows, pa.date32()),
+            }
+        )
+        for i in range(count)
+    ]
+
+
+def test_collect_batches_keeps_to_dataframe_dtypes():
+    df = collect_batches(_batches(1, rows=4))
+
+    assert str(df["qty"].dtype) == "Int64"
+    assert df["qty"].isna().tolist() == [False, True, False, True]
+    assert str(df["day"].dtype) == "dbdate"
+
+
+def test_collect_batches_spills_above_threshold_regardless_of_held_frames(monkeypatch):
+    batch_bytes = _batches(1)[0].nbytes
+    monkeypatch.setattr(result_store, "RESULT_SPILL_THRESHOLD_BYTES", batch_bytes * 2)
+    monkeypatch.setattr(accountant, "held_bytes", accountant.limit_bytes * 2)
+
+    assert isinstance(collect_batches(_batches(2)), pd.DataFrame)
+    spilled = collect_batches(_batches(3))
+
+    assert isinstance(spilled, SpilledResult)
+    assert len(spilled) == 3000
+    assert str(spilled.head()["qty"].dtype) == "Int64"
+
+
+def test_spilled_describe_is_computed_while_writing(monkeypatch):
+    monkeypatch.setattr(result_store, "RESULT_SPILL_THRESHOLD_BYTES", 0)
+    spilled = collect_batches(_batches(2))
+
+    def fail_scan(*args, **kwargs):
+        raise AssertionError("describe() rescanned the file")
+
+    monkeypatch.setattr(spilled._file, "iter_batches", fail_scan)
+    stats = spilled.describe()
+
+    assert stats.loc["count", "id"] == 2000
+    assert stats.loc["max", "id"] == 1999
+    assert stats.loc["count", "qty"] == 1000
+    assert stats.loc["min", "qty"] == 0
+    assert "day" not in stats.columns
+
+
+def test_spilled_filter_respects_max_bytes(monkeypatch):
+    monkeypatch.setattr(result_store, "RESULT_SPILL_THRESHOLD_BYTES", 0)
+    spilled = collect_batches(_batches(2))
+
+    assert spilled.filter("id < 10", max_bytes=10**6)["id"].tolist() == list(range(10))
+    assert spilled.filter(None, max_bytes=100) is None
+
+
+def test_tracked_frames_are_released_when_collected():
+    before = accountant.held_bytes
+    df = collect_batches(_batches(1))
+    assert accountant.held_bytes > before
+
+    del df
+    gc.collect()
+
+    assert accountant.held_bytes == before
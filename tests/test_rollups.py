@@ -0,0 +1,66 @@
+import re
+
+import pytest
+
+from src.rollups import ROLLUPS, RollupManager
+
+
+class _StubRunner:
+    class client:
+        project = "project"
+
+
+@pytest.mark.parametrize("rollup", ROLLUPS, ids=lambda rollup: rollup.name)
+def test_rollup_templates_fill_every_placeholder(rollup):
+    table = f"project.rollups.{rollup.name}"
+
+    build = rollup.build_sql.format(table=table)
+    refresh = rollup.refresh_sql.format(table=table, restatement_days=90)
+
+    assert not re.search(r"[{}]", build + refresh)
+    assert f"`{table}`" in build and f"`{table}`" in refresh
+
+
+def test_status_dependent_rollups_restate_a_trailing_window():
+    for rollup in ROLLUPS:
+        if "status" in rollup.build_sql:
+            assert "{restatement_days}" in rollup.refresh_sql
+
+
+def test_refresh_replaces_rows_inside_a_transaction():
+    for rollup in ROLLUPS:
+        statements = [
+            statement.strip().split()[0].upper()
+            for statement in rollup.refresh_sql.split(";")
+            if statement.strip()
+        ]
+        begin = statements.index("BEGIN")
+
+        assert statements[begin:] == ["BEGIN", "DELETE", "INSERT", "COMMIT"]
+
+
+def test_qualify_points_rollup_references_at_the_rollup_dataset():
+    manager = RollupManager(_StubRunner(), "rollups")
+
+    sql = manager.qualify(
+        "SELECT SUM(d.revenue) AS revenue FROM `daily_sales_by_category` d "
+        "JOIN other.user_rfm_features r ON TRUE"
+    )
+
+    assert sql == (
+        "SELECT SUM(d.revenue) AS revenue FROM `project.rollups.daily_sales_by_category` d "
+        "JOIN `project.rollups.user_rfm_features` r ON TRUE"
+    )
+
+
+def test_qualify_leaves_column_references_and_longer_names_alone():
+    manager = RollupManager(_StubRunner(), "rollups")
+    sql = (
+        "SELECT EXTRACT(YEAR FROM user_rfm_features.last_order_at) AS year "
+        "FROM user_rfm_features JOIN user_rfm_features_v2 v ON TRUE"
+    )
+
+    assert manager.qualify(sql) == (
+        "SELECT EXTRACT(YEAR FROM user_rfm_features.last_order_at) AS year "
+        "FROM `project.rollups.user_rfm_features` JOIN user_rfm_features_v2 v ON TRUE"
+    )
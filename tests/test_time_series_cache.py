@@ -0,0 +1,174 @@
+from datetime import date, datetime, timezone
+
+import pandas as pd
+import pytest
+
+from src import time_series_cache
+from src.time_series_cache import TimeSeriesCache, bucket_start, next_bucket
+from src.tools import QueryParameter, SelectExpression, TimeGrain, TimeSeriesSpec
+
+TODAY = date(2024, 3, 20)
+
+
+class _StubRunner:
+    """Returns one row per month in the queried window and records each window."""
+
+    def __init__(self):
+        self.windows = []
+        self.parameters = []
+
+    def execute_query(self, sql_query, query_parameters, use_cache=True):
+        values = {p.name: p.value for p in query_parameters}
+        start = date.fromisoformat(values.pop("ts_window_start"))
+        end = date.fromisoformat(values.pop("ts_window_end"))
+        self.windows.append((start, end))
+        self.parameters.append(values)
+        buckets = []
+        while start < end:
+            buckets.append(start)
+            start = next_bucket(start, TimeGrain.MONTH)
+        return pd.DataFrame(
+            {"time_period": buckets, "orders": [len(self.windows)] * len(buckets)}
+        )
+
+
+def _spec(start_date, end_date=None, filter_clause=None, from_clause="`orders` o"):
+    return TimeSeriesSpec(
+        from_clause=from_clause,
+        timestamp_column="o.created_at",
+        grain=TimeGrain.MONTH,
+        metrics=[SelectExpression(expression="COUNT(*)", alias="orders")],
+        filter_clause=filter_clause,
+        start_date=start_date,
+        end_date=end_date,
+    )
+
+
+@pytest.mark.parametrize(
+    "day, grain, start, following",
+    [
+        (date(2024, 3, 20), TimeGrain.DAY, date(2024, 3, 20), date(2024, 3, 21)),
+        (date(2024, 3, 20), TimeGrain.WEEK, date(2024, 3, 17), date(2024, 3, 24)),
+        (date(2024, 12, 5), TimeGrain.MONTH, date(2024, 12, 1), date(2025, 1, 1)),
+        (date(2024, 11, 5), TimeGrain.QUARTER, date(2024, 10, 1), date(2025, 1, 1)),
+        (date(2024, 11, 5), TimeGrain.YEAR, date(2024, 1, 1), date(2025, 1, 1)),
+    ],
+)
+def test_bucket_boundaries_match_date_trunc(day, grain, start, following):
+    assert bucket_start(day, grain) == start
+    assert next_bucket(start, grain) == following
+
+
+def test_repeat_request_only_queries_the_current_bucket():
+    runner = _StubRunner()
+    cache = TimeSeriesCache(runner)
+
+    first = cache.query(_spec("2023-01-01"), today=TODAY)
+    second = cache.query(_spec("2023-01-01"), today=TODAY)
+
+    assert runner.windows == [
+        (date(2023, 1, 1), date(2024, 4, 1)),
+        (date(2024, 3, 1), date(2024, 4, 1)),
+    ]
+    assert len(first) == len(second) == 15
+    # Past buckets come from the cache, the current bucket from the delta query
+    assert second["orders"].tolist() == [1] * 14 + [2]
+
+
+def test_extended_window_queries_only_the_missing_buckets():
+    runner = _StubRunner()
+    cache = TimeSeriesCache(runner)
+
+    cache.query(_spec("2023-06-01", "2024-01-01"), today=TODAY)
+    result = cache.query(_spec("2023-01-01"), today=TODAY)
+
+    assert runner.windows == [
+        (date(2023, 6, 1), date(2024, 1, 1)),
+        (date(2023, 1, 1), date(2023, 6, 1)),
+        (date(2024, 1, 1), date(2024, 4, 1)),
+    ]
+    assert result["time_period"].tolist() == list(
+        pd.date_range("2023-01-01", "2024-03-01", freq="MS")
+    )
+
+
+def test_window_parameters_of_the_generated_sql_do_not_split_entries():
+    runner = _StubRunner()
+    cache = TimeSeriesCache(runner)
+
+    for start in ("2023-06-01", "2023-01-01"):
+        # The generated SQL binds its own window as @start_date; the spec does not use it
+        parameters = [
+            QueryParameter(name="start_date", type="DATE", value=start),
+            QueryParameter(name="gender", type="STRING", value="F"),
+        ]
+        cache.query(
+            _spec(start, filter_clause="o.gender = @gender"), parameters, today=TODAY
+        )
+
+    assert runner.windows == [
+        (date(2023, 6, 1), date(2024, 4, 1)),
+        (date(2023, 1, 1), date(2023, 6, 1)),
+        (date(2024, 3, 1), date(2024, 4, 1)),
+    ]
+    assert runner.parameters == [{"gender": "F"}] * 3
+
+
+def test_default_today_is_the_utc_date(monkeypatch):
+    runner = _StubRunner()
+
+    class _Clock(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            # 23:30 UTC on 2024-03-31 is already April in time zones ahead of UTC
+            return datetime(2024, 3, 31, 23, 30, tzinfo=timezone.utc).astimezone(tz)
+
+    monkeypatch.setattr(time_series_cache, "datetime", _Clock)
+    TimeSeriesCache(runner).query(_spec("2024-01-01"))
+
+    assert runner.windows == [(date(2024, 1, 1), date(2024, 4, 1))]
+
+
+def test_narrower_window_is_served_from_cache():
+    runner = _StubRunner()
+    cache = TimeSeriesCache(runner)
+
+    cache.query(_spec("2023-01-01", "2024-01-01"), today=TODAY)
+    result = cache.query(_spec("2023-03-01", "2023-05-01"), today=TODAY)
+
+    assert len(runner.windows) == 1
+    assert result["time_period"].tolist() == [
+        pd.Timestamp("2023-03-01"),
+        pd.Timestamp("2023-04-01"),
+    ]
+
+
+def test_different_filters_are_cached_separately():
+    runner = _StubRunner()
+    cache = TimeSeriesCache(runner)
+
+    cache.query(_spec("2023-01-01", "2024-01-01", "o.gender = 'F'"), today=TODAY)
+    cache.query(_spec("2023-01-01", "2024-01-01", "o.gender = 'M'"), today=TODAY)
+
+    assert len(runner.windows) == 2
+
+
+@pytest.mark.parametrize(
+    "spec",
+    [
+        _spec("2023-06-15"),
+        _spec("2023-06-01", "2023-12-15"),
+        _spec("2023-06-01", filter_clause="o.status = 'Complete'"),
+        _spec(
+            "2023-06-01",
+            from_clause="`orders` o JOIN `order_items` oi ON oi.order_id = o.order_id "
+            "AND oi.status = 'Complete'",
+        ),
+    ],
+)
+def test_uncacheable_specs_are_rejected_without_querying(spec):
+    runner = _StubRunner()
+
+    with pytest.raises(ValueError):
+        TimeSeriesCache(runner).query(spec, today=TODAY)
+    assert runner.windows == []